@@ -1,4 +1,7 @@
+import json
 import logging
+import os
+from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,8 +9,29 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.routers import users
 from app.routers import playlists
 from app.routers import recommendations
+from app.routers import batch
+from app.routers import metrics
+from app.routers import profiles
+from app.services.service_factory import ServiceFactory
+from app.utils.service_metrics import service_metrics
+from framework.middleware.deadline import DeadlineMiddleware
+from framework.middleware.metrics import MetricsMiddleware
+from framework.middleware.profiling import ProfilingMiddleware
+from framework.middleware.tracing import TracingMiddleware
+from framework.utils.json_response import FastJSONResponse
+from framework.utils.metrics import REGISTRY
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Services live for the whole process; build them once and tear them down on exit
+    await ServiceFactory.startup()
+    yield
+    # Reverse creation order: the span exporter goes last, after the write-behind buffers drain
+    await ServiceFactory.shutdown()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # origins = [
 #     "http://localhost:3000" # React UI
@@ -23,11 +47,32 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# Time budget per request; REQUEST_DEADLINE_ROUTES overrides it by path prefix, e.g. {"/chats": 20}
+app.add_middleware(
+    DeadlineMiddleware,
+    default=float(os.getenv('REQUEST_DEADLINE', 30)) or None,
+    routes=json.loads(os.getenv('REQUEST_DEADLINE_ROUTES', '{}')),
+)
+# Only installed when a profiling key is set, so requests pay nothing otherwise
+if os.getenv('PROFILE_KEY'):
+    app.add_middleware(ProfilingMiddleware, profiler=lambda: ServiceFactory.get_service("Profiler"))
+# Correlation ids, Server-Timing and span export; outside the deadline so its spans cover it
+app.add_middleware(
+    TracingMiddleware,
+    export=lambda trace: ServiceFactory.get_service("SpanExporter").export(trace),
+)
+# Outermost, so the recorded latency covers the whole middleware stack
+app.add_middleware(MetricsMiddleware)
+REGISTRY.add_collector(service_metrics)
+
 
 
 app.include_router(users.router)
 app.include_router(playlists.router)
 app.include_router(recommendations.router)
+app.include_router(batch.router)
+app.include_router(metrics.router)
+app.include_router(profiles.router)
 
 
 @app.get("/")
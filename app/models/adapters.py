@@ -0,0 +1,22 @@
+from typing import List, TypeVar
+
+from httpx import Response
+from pydantic import TypeAdapter
+
+from app.models.batch import BatchResponseItem
+from app.models.playlist import Playlist, PlaylistInfo
+from app.models.song import Song
+
+T = TypeVar("T")
+
+# Built once at import: constructing a TypeAdapter compiles a validator, so
+# it must not happen per request.
+PLAYLIST_INFO_LIST = TypeAdapter(List[PlaylistInfo])
+PLAYLIST_LIST = TypeAdapter(List[Playlist])
+SONG_LIST = TypeAdapter(List[Song])
+BATCH_RESPONSE_LIST = TypeAdapter(List[BatchResponseItem])
+
+
+def validate_response(adapter: TypeAdapter[T], response: Response) -> T:
+    """Parse and validate a downstream response body in a single pass over its bytes."""
+    return adapter.validate_json(response.content)
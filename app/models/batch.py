@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class BatchRequestItem(BaseModel):
+    id: Optional[str] = None                # Echoed back so the caller can match responses
+    method: str = "GET"
+    path: str                               # e.g. /users/{user_id}/playlists
+    query: Optional[Dict[str, Any]] = None  # Query string parameters
+    body: Optional[Any] = None              # JSON body for POST/PUT
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchRequestItem]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "requests": [
+                    {"id": "user", "path": "/users/alexracape"},
+                    {"id": "playlists", "path": "/users/alexracape/playlists"},
+                    {"id": "playlist", "path": "/playlists/37i9dQZF1DXcBWIGoYBM5M"}
+                ]
+            }
+        }
+
+
+class BatchResponseItem(BaseModel):
+    id: Optional[str] = None
+    status: int
+    body: Optional[Any] = None
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import sys
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from app.models.adapters import SONG_LIST
+from app.models.song import Song
+from framework.utils.json_response import dumps, loads
+
+# Numeric Song fields, stored as float64 columns (NaN for missing values)
+FEATURE_FIELDS = (
+    "track_popularity",
+    "danceability",
+    "energy",
+    "key",
+    "loudness",
+    "mode",
+    "speechiness",
+    "acousticness",
+    "instrumentalness",
+    "liveness",
+    "valence",
+    "tempo",
+    "duration_ms",
+)
+
+# Text Song fields, stored as lists of interned strings (None for missing values)
+STRING_FIELDS = (
+    "track_id",
+    "track_name",
+    "track_artist",
+    "track_album_id",
+    "track_album_name",
+    "track_album_release_date",
+    "playlist_name",
+    "playlist_id",
+    "playlist_genre",
+    "playlist_subgenre",
+)
+
+SONG_FIELDS = tuple(Song.model_fields)
+
+
+class SongBatch:
+    """Column-oriented list of songs.
+
+    Audio features live in one (n, 13) float array and text fields in lists of
+    interned strings, so a recommendation result costs a few hundred bytes per
+    song instead of a full pydantic model. `Song` objects are only built when
+    a caller iterates or indexes the batch.
+    """
+
+    def __init__(self, features: np.ndarray, strings: dict):
+        self.features = features  # shape (n, len(FEATURE_FIELDS))
+        self.strings = strings    # field name -> list of str | None
+
+    def __len__(self):
+        return self.features.shape[0]
+
+    def __iter__(self) -> Iterator[Song]:
+        return (self[i] for i in range(len(self)))
+
+    def __getitem__(self, i: int) -> Song:
+        return Song.model_construct(**self._record(i))
+
+    def __repr__(self):
+        return f"SongBatch({len(self)} songs)"
+
+    def __eq__(self, other):
+        if not isinstance(other, SongBatch):
+            return NotImplemented
+        return self.to_records() == other.to_records()
+
+    @classmethod
+    def empty(cls) -> SongBatch:
+        return cls(np.empty((0, len(FEATURE_FIELDS))), {field: [] for field in STRING_FIELDS})
+
+    @classmethod
+    def from_records(cls, records: Sequence[dict]) -> SongBatch:
+        """Build a batch from decoded JSON objects (e.g. the Spotify adapter's response).
+
+        Each feature column is converted by NumPy in one call. Raises
+        ValueError when the payload is not a list of objects or a field has
+        the wrong type, as validating it into `List[Song]` would.
+        """
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ValueError("Expected a JSON array of song objects")
+        if not records:
+            return cls.empty()
+        columns = []
+        for field in FEATURE_FIELDS:
+            try:
+                column = np.array([record.get(field) for record in records], dtype=float)  # None -> NaN
+            except (TypeError, ValueError):
+                column = None
+            if column is None or column.ndim != 1:
+                raise ValueError(f"Song field {field} must be a number or null")
+            columns.append(column)
+        strings = {}
+        for field in STRING_FIELDS:
+            values = [record.get(field) for record in records]
+            if not all(value is None or type(value) is str for value in values):
+                raise ValueError(f"Song field {field} must be a string or null")
+            strings[field] = [None if value is None else sys.intern(value) for value in values]
+        return cls(np.column_stack(columns), strings)
+
+    @classmethod
+    def from_json(cls, raw: bytes) -> SongBatch:
+        return cls.from_records(loads(raw))
+
+    @classmethod
+    def from_songs(cls, songs: Iterable[Song]) -> SongBatch:
+        # One pydantic-core pass over the list instead of a model_dump() per song
+        return cls.from_records(SONG_LIST.dump_python(list(songs)))
+
+    @classmethod
+    def concat(cls, batches: Sequence[SongBatch]) -> SongBatch:
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+        features = np.concatenate([batch.features for batch in batches])
+        strings = {field: [value for batch in batches for value in batch.strings[field]] for field in STRING_FIELDS}
+        return cls(features, strings)
+
+    @property
+    def track_ids(self) -> List[Optional[str]]:
+        return self.strings["track_id"]
+
+    def column(self, field: str) -> np.ndarray:
+        """Float column for one audio feature."""
+        return self.features[:, FEATURE_FIELDS.index(field)]
+
+    def take(self, indices: Sequence[int]) -> SongBatch:
+        """New batch containing the rows at `indices`, in that order."""
+        indices = list(indices)
+        return SongBatch(
+            self.features[indices] if indices else np.empty((0, len(FEATURE_FIELDS))),
+            {field: [values[i] for i in indices] for field, values in self.strings.items()},
+        )
+
+    def to_songs(self) -> List[Song]:
+        return list(self)
+
+    def to_records(self) -> List[dict]:
+        """JSON-ready dicts in Song field order, with missing values as None."""
+        columns = {field: self.strings[field] for field in STRING_FIELDS}
+        # tolist() turns the whole array into Python floats in one pass
+        for col, values in zip(FEATURE_FIELDS, self.features.T.tolist()):
+            columns[col] = [None if v != v else v for v in values]  # NaN -> None
+        return [
+            {field: columns[field][row] for field in SONG_FIELDS}
+            for row in range(len(self))
+        ]
+
+    def to_json(self) -> bytes:
+        return dumps(self.to_records())
+
+    def _record(self, i: int) -> dict:
+        record = {field: self.strings[field][i] for field in STRING_FIELDS}
+        for field, value in zip(FEATURE_FIELDS, self.features[i].tolist()):
+            record[field] = None if value != value else value
+        return record
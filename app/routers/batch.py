@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import os
+from typing import List
+
+import httpx
+from fastapi import APIRouter, HTTPException, Request, status, Depends
+from fastapi.security import OAuth2PasswordBearer
+
+from app.models.adapters import BATCH_RESPONSE_LIST
+from app.models.batch import BatchRequest, BatchRequestItem, BatchResponseItem
+from app.services.service_factory import ServiceFactory
+from app.utils import jwt_claims
+from framework.middleware.tracing import correlation_id
+from framework.utils.json_response import adapter_response
+
+logger = logging.getLogger("uvicorn")
+router = APIRouter()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", 20))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_METHODS = ("GET", "POST", "PUT", "DELETE")
+# ASGI scope extension set on every sub-request, so /batch can never run inside a batch
+BATCH_EXTENSION = "batch.sub_request"
+
+
+def _mark_sub_requests(app):
+    async def marked(scope, receive, send):
+        extensions = dict(scope.get("extensions") or {}, **{BATCH_EXTENSION: {}})
+        await app(dict(scope, extensions=extensions), receive, send)
+    return marked
+
+
+@router.post("/batch", tags=["batch"], status_code=status.HTTP_200_OK)
+async def batch(request: Request, batch_request: BatchRequest, token: str = Depends(oauth2_scheme)) -> List[BatchResponseItem]:
+    """Run several API calls in one round-trip
+
+    The token is decoded once up front and its claims are shared with the
+    sub-requests, which are dispatched in-process to the existing routes
+    (these still enforce their own scopes without decoding the JWT again)
+    with at most BATCH_CONCURRENCY running at a time. Every item gets its own
+    status and body, so one failing call does not fail the batch.
+    """
+    cid = correlation_id()
+    logger.info(f"Incoming Request - Method: POST, Path: /batch, Items: {len(batch_request.requests)} - [{cid}]")
+
+    if BATCH_EXTENSION in (request.scope.get("extensions") or {}):
+        raise HTTPException(status_code=400, detail="A batch cannot contain another batch")
+
+    user_service = ServiceFactory.get_service("User")
+    claims = user_service.get_claims(token, cid)
+    if not claims or not claims.get("sub"):
+        raise HTTPException(status_code=401, detail="Invalid Token")
+    if len(batch_request.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {BATCH_MAX_REQUESTS} requests")
+
+    jwt_claims.verified(token, claims)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    headers = {"Authorization": f"Bearer {token}", "X-Correlation-ID": cid}
+    transport = httpx.ASGITransport(app=_mark_sub_requests(request.app))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://batch") as client:
+        async def run(item: BatchRequestItem) -> BatchResponseItem:
+            method = item.method.upper()
+            unsupported = BatchResponseItem(id=item.id, status=400, body={"detail": f"Unsupported request {method} {item.path}"})
+            if method not in BATCH_METHODS or not item.path.startswith("/"):
+                return unsupported
+            try:
+                sub_request = client.build_request(method, item.path, params=item.query, json=item.body, headers=headers)
+            except (httpx.InvalidURL, TypeError, ValueError):
+                return unsupported
+            # Check the path as the app will route it: httpx decodes %-escapes and
+            # resolves dot segments, so /%62atch and /x/../batch both arrive as /batch
+            if sub_request.url.path.rstrip("/") == "/batch":
+                return unsupported
+            async with semaphore:
+                try:
+                    response = await client.send(sub_request)
+                except Exception as e:
+                    logger.error(f"Batch item {method} {item.path} failed: {e} - [{cid}]")
+                    return BatchResponseItem(id=item.id, status=500, body={"detail": str(e)})
+            try:
+                body = response.json()
+            except ValueError:
+                body = response.text
+            return BatchResponseItem(id=item.id, status=response.status_code, body=body)
+
+        return adapter_response(BATCH_RESPONSE_LIST, await asyncio.gather(*(run(item) for item in batch_request.requests)))
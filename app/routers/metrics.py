@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from framework.utils.metrics import REGISTRY
+
+router = APIRouter()
+
+
+@router.get("/metrics", tags=["metrics"], response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Prometheus text-format metrics for this process"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
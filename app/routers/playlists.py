@@ -1,11 +1,15 @@
 import logging
 from fastapi import APIRouter, HTTPException, Query, Request, status, Depends
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import OAuth2PasswordBearer
+from pydantic import ValidationError
 from typing import Optional, List
-import uuid
 
 from app.models.playlist import PlaylistContent, PlaylistInfo
+from app.models.adapters import PLAYLIST_INFO_LIST
 from app.services.service_factory import ServiceFactory
+from framework.middleware.tracing import correlation_id
+from framework.utils.json_response import adapter_response, model_response
 
 logger = logging.getLogger("uvicorn")
 router = APIRouter()
@@ -24,7 +28,7 @@ async def login_for_access_token(
 async def get_playlists(user_id: str, include_tracks: Optional[bool] = Query(False), token: str = Depends(oauth2_scheme)) -> List[PlaylistInfo]:
     """ Get user's playlists from our database; if no data, get from Spotify API"""
     
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
     logger.info(f"Incoming Request - Method: GET, Path: /playlists/{user_id} - [{cid}]")
     playlist_service = ServiceFactory.get_service("Playlist")
     if not playlist_service.validate_token(token, scope=("/users/{user_id}/playlists", "GET")):
@@ -35,7 +39,7 @@ async def get_playlists(user_id: str, include_tracks: Optional[bool] = Query(Fal
 
     try:
         # Get details from playlist database, if no data, get from spotify
-        playlists = playlist_service.get_playlists(user_id, token, cid)
+        playlists = await playlist_service.get_playlists(user_id, token, cid)
         logger.debug(f"Playlist info received - [{cid}]")
         if not playlists:
             # TODO: get from spotify
@@ -44,7 +48,7 @@ async def get_playlists(user_id: str, include_tracks: Optional[bool] = Query(Fal
                 logger.error(f"Failed to get playlist info for user {user_id} - [{cid}]")
                 raise HTTPException(status_code=400, detail="Spotify Login Failed")
 
-        return playlists
+        return adapter_response(PLAYLIST_INFO_LIST, playlists)
 
     except Exception as e:
         # raise nested exception instead of generic 500
@@ -56,20 +60,20 @@ async def get_playlists(user_id: str, include_tracks: Optional[bool] = Query(Fal
 async def get_playlist(playlist_id: str, token: str = Depends(oauth2_scheme)) -> PlaylistInfo:
     """ Get a playlist by playlist_id, return the playlist info"""
     
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
     logger.info(f"Incoming Request - Method: GET, Path: /playlist/{playlist_id} - [{cid}]")
     playlist_service = ServiceFactory.get_service("Playlist")
-    if not playlist_service.validate_token(token, scope=("/playlist/{playlist_id}", "GET")):
+    if not playlist_service.validate_token(token, scope=("/playlists/{playlist_id}", "GET")):
         raise HTTPException(status_code=401, detail="Invalid Token")
 
     try:
         # Get details from playlist database, if no data, get from spotify
-        playlist = playlist_service.get_playlist(playlist_id, token, cid)
+        playlist = await playlist_service.get_playlist(playlist_id, token, cid)
         logger.debug(f"Playlist info received - [{cid}]")
         if not playlist:
             logger.error(f"Failed to get playlist info of {playlist_id} - [{cid}]")
             raise HTTPException(status_code=400, detail=f"Could not get this playlist {playlist_id}")
-        return playlist
+        return model_response(playlist)
 
     except Exception as e:
         # raise nested exception instead of generic 500
@@ -79,18 +83,21 @@ async def get_playlist(playlist_id: str, token: str = Depends(oauth2_scheme)) ->
 
 @router.post("/playlists/{playlist_id}", tags=["playlists"], status_code=status.HTTP_202_ACCEPTED)
 async def update_playlist(playlist_id: str, request: Request):
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
     data = await request.json()
-    playlist_info = data.get("playlist_info")
-    playlist_content = data.get("playlist_content")
     token = data.get("token")
     logger.info(f"Incoming Request - Method: POST, Path: /playlist/{playlist_id} - [{cid}]")
     playlist_service = ServiceFactory.get_service("Playlist")
-    if not playlist_service.validate_token(token, scope=("/playlist/{playlist_id}", "POST")):
+    if not playlist_service.validate_token(token, scope=("/playlists/{playlist_id}", "POST")):
         raise HTTPException(status_code=401, detail="Invalid Token")
+    try:
+        playlist_info = PlaylistInfo.model_validate(data.get("playlist_info"))
+        playlist_content = PlaylistContent.model_validate(data.get("playlist_content"))
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
 
     try:
-        message = playlist_service.update_playlist(playlist_id, playlist_info, playlist_content, token, cid)
+        message = await playlist_service.update_playlist(playlist_id, playlist_info, playlist_content, token, cid)
         logger.debug(f"Playlist info and content received - [{cid}]")
         if not message:
             logger.error(f"Failed to update playlist info for {playlist_id} - [{cid}]")
@@ -105,14 +112,14 @@ async def update_playlist(playlist_id: str, request: Request):
 
 @router.delete("/playlists/{playlist_id}", tags=["playlists"], status_code=status.HTTP_200_OK)
 async def delete_playlist(playlist_id: str, token: str = Depends(oauth2_scheme)):
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
     logger.info(f"Incoming Request - Method: DELETE, Path: /playlist/{playlist_id} - [{cid}]")
     playlist_service = ServiceFactory.get_service("Playlist")
-    if not playlist_service.validate_token(token, scope=("/playlist/{playlist_id}", "DELETE")):
+    if not playlist_service.validate_token(token, scope=("/playlists/{playlist_id}", "DELETE")):
         raise HTTPException(status_code=401, detail="Invalid Token")
 
     try:
-        message = playlist_service.delete_playlist(playlist_id, token, cid)
+        message = await playlist_service.delete_playlist(playlist_id, token, cid)
         logger.debug(f"Playlist id received - [{cid}]")
         if not message:
             logger.error(f"Failed to delete playlist info for {playlist_id} - [{cid}]")
@@ -128,14 +135,14 @@ async def delete_playlist(playlist_id: str, token: str = Depends(oauth2_scheme))
 
 @router.delete("/playlists/{playlist_id}/tracks/{track_id}", tags=["playlists"], status_code=status.HTTP_200_OK)
 async def delete_song(playlist_id: str, track_id: str, token: str = Depends(oauth2_scheme)):
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
     logger.info(f"Incoming Request - Method: DELETE, Path: /playlist/{playlist_id} - [{cid}]")
     playlist_service = ServiceFactory.get_service("Playlist")
-    if not playlist_service.validate_token(token, scope=("/playlist/{playlist_id}/tracks/{track_id}", "DELETE")):
+    if not playlist_service.validate_token(token, scope=("/playlists/{playlist_id}/tracks/{track_id}", "DELETE")):
         raise HTTPException(status_code=401, detail="Invalid Token")
 
     try:
-        message = playlist_service.delete_song(playlist_id, track_id, token, cid)
+        message = await playlist_service.delete_song(playlist_id, track_id, token, cid)
         logger.debug(f"Playlist id and Track id received - [{cid}]")
         if not message:
             logger.error(f"Failed to delete song info for {playlist_id} - [{cid}]")
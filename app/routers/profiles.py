@@ -0,0 +1,57 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+
+from app.services.service_factory import ServiceFactory
+from framework.middleware.profiling import PROFILE_HEADER, RequestProfiler
+
+router = APIRouter()
+
+
+class ProfilingSettings(BaseModel):
+    sample_rate: float = Field(ge=0.0, le=1.0)
+    route_prefix: str = "/"
+
+
+def admin_profiler(key: Optional[str] = Header(None, alias=PROFILE_HEADER)) -> RequestProfiler:
+    """The profiler, for callers holding the profiling key; 404 when profiling is not configured."""
+    profiler = ServiceFactory.get_service("Profiler")
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiler.authorized(key):
+        raise HTTPException(status_code=403, detail="Invalid profiling key")
+    return profiler
+
+
+@router.get("/admin/profiles", tags=["admin"])
+async def list_profiles(profiler: RequestProfiler = Depends(admin_profiler)):
+    """Lists stored request profiles, newest first, with the current sampling settings"""
+    return {**profiler.stats(), "profiles": await profiler.store.list()}
+
+
+@router.get("/admin/profiles/{profile_id}", tags=["admin"])
+async def get_profile(profile_id: str,
+                      format: str = Query("text", pattern="^(text|pstats)$"),
+                      sort: str = Query("cumulative", pattern="^(cumulative|tottime|ncalls)$"),
+                      limit: int = Query(50, ge=1, le=1000),
+                      profiler: RequestProfiler = Depends(admin_profiler)):
+    """Gets one profile, as a pstats report or the raw pstats file"""
+    if format == "pstats":
+        path = profiler.store.path(profile_id)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+    report = await profiler.store.summary(profile_id, sort=sort, limit=limit)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(report)
+
+
+@router.put("/admin/profiling", tags=["admin"])
+async def update_profiling(settings: ProfilingSettings, profiler: RequestProfiler = Depends(admin_profiler)):
+    """Sets the share of requests under `route_prefix` that are profiled (0 turns sampling off)"""
+    profiler.sample_rate = settings.sample_rate
+    profiler.route_prefix = settings.route_prefix
+    return profiler.stats()
@@ -1,27 +1,108 @@
+import asyncio
+import json
 import logging
+import os
 import uuid
 from typing import Optional, List, Union
 from fastapi import APIRouter, HTTPException, Request, status, Query, Depends
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 
 from app.models.chat import Message, ChatData, WebChat
 from app.models.song import Song, Traits
+from app.models.song_batch import SongBatch
 from app.services.service_factory import ServiceFactory
+from framework.middleware import deadline
+from framework.middleware.tracing import correlation_id
+from framework.utils.json_response import FastJSONResponse
 
 logger = logging.getLogger("uvicorn")
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Below this many seconds left of the request deadline, /chats replies without songs
+RECOMMENDATION_MIN_BUDGET = float(os.getenv("RECOMMENDATION_MIN_BUDGET", 2))
+
+_speculative_tasks = set()  # keeps detached speculative work alive until it completes
+
 class RecommendationRequest(BaseModel):
     message: str
     userId: str
 
 
+def _songs_response(songs: SongBatch) -> Response:
+    """Serialize a SongBatch straight to JSON, without building Song models."""
+    return Response(content=songs.to_json(), media_type="application/json")
+
+
+def _web_chat_response(content: str, songs: Optional[SongBatch], chat_id: str) -> Response:
+    """JSON body of a WebChat, with the songs serialized from their columns."""
+    return FastJSONResponse({
+        "content": content,
+        "songs": songs.to_records() if songs is not None else None,
+        "chat_id": chat_id,
+    })
+
+
+async def _recommend_within_deadline(token: str, traits: Traits, token_task: asyncio.Task, cid: str) -> Optional[SongBatch]:
+    """Recommendations for a chat reply, or None when the deadline leaves no time or there is no Spotify token.
+
+    The chat text is the part the user is waiting for; songs are dropped
+    rather than failing the whole turn when the budget runs out.
+    """
+    if deadline.expired(RECOMMENDATION_MIN_BUDGET):
+        logger.warning(f"Skipping recommendations, {deadline.remaining():.2f}s left of the request deadline - [{cid}]")
+        return None
+    recommendation_service = ServiceFactory.get_service("Recommendation")
+    try:
+        # The speculative task runs without the deadline, so bound the wait here
+        try:
+            spotify_token = await asyncio.wait_for(asyncio.shield(token_task), deadline.remaining())
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Request deadline exceeded") from None
+        if spotify_token is None:
+            logger.warning(f"Skipping recommendations, the user has no Spotify token - [{cid}]")
+            return None
+        return await recommendation_service.get_recommendations(token, spotify_token, traits, cid)
+    except HTTPException as e:
+        if e.status_code == status.HTTP_504_GATEWAY_TIMEOUT and deadline.expired(RECOMMENDATION_MIN_BUDGET):
+            logger.warning(f"Dropping recommendations, request deadline reached: {e.detail} - [{cid}]")
+            return None
+        raise
+
+
+def _speculate(step: str, cid: str, coro) -> asyncio.Task:
+    """Start work the request may not use, detached from the request's deadline.
+
+    The task keeps running after the response (or an error) if nobody awaits
+    it, so a token refresh is not cut short; failures are logged.
+    """
+    async def detached():
+        deadline.clear()
+        return await coro
+
+    def done(task: asyncio.Task):
+        _speculative_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Speculative step {step} failed: {task.exception()} - [{cid}]")
+
+    task = asyncio.create_task(detached())
+    _speculative_tasks.add(task)
+    task.add_done_callback(done)
+    return task
+
+
 @router.post("/chats", tags=["chats"], status_code=status.HTTP_200_OK)
 async def general_chat(request: Request) -> WebChat:
-    """Process the general chat and give the recommendation when needed"""
-    cid = str(uuid.uuid4())
+    """Process the general chat and give the recommendation when needed
+
+    Steps run as a small dependency graph rather than one after another:
+      - chat history and song writes are queued on write-behind buffers
+      - the Spotify token is fetched speculatively while the agent is thinking
+      - recommendations wait on both the agent traits and the token
+    """
+    cid = correlation_id()
     data = await request.json()
     user_id = data.get("user_id")
     chat_id = data.get("chat_id")
@@ -33,6 +114,7 @@ async def general_chat(request: Request) -> WebChat:
 
     logger.info(f"Incoming Request - Method: POST, Path: /chats - [{cid}]")
     chat_service = ServiceFactory.get_service("Chat")
+    user_service = ServiceFactory.get_service("User")
     chat_data = ChatData(
         content=query,
         role="human",
@@ -44,10 +126,13 @@ async def general_chat(request: Request) -> WebChat:
     if not chat_service.validate_token(token, id=user_id, scope=("/chats", "POST")):
         raise HTTPException(status_code=401, detail="Invalid Token")
 
+    # Speculative: most turns end in a recommendation, so start on the token now
+    token_task = _speculate("get_spotify_token", cid, user_service.get_spotify_token(user_id, token, cid))
+
     try:
         # Get natural language response and optionally traits
-        chat_service.update_chat_database(chat_data, cid)
-        agent_response = chat_service.general_chat(query=query, user_id=user_id, chat_id=chat_id, cid=cid)
+        await chat_service.save_chat(chat_data, cid)
+        agent_response = await chat_service.general_chat(query=query, user_id=user_id, chat_id=chat_id, cid=cid)
         if agent_response:
             chat_message = agent_response.content
             chat_data = ChatData(
@@ -57,27 +142,25 @@ async def general_chat(request: Request) -> WebChat:
                 chat_id=chat_id,
                 user_id=user_id
             )
-            chat_service.update_chat_database(chat_data, cid)
+            await chat_service.save_chat(chat_data, cid)
+            songs = None
             if agent_response.traits:
                 # traits = chat_service.extract_song_traits(agent_response.traits)
                 traits = agent_response.traits
                 logger.debug(f"Got song traits: {traits} - [{cid}]")
-                recommendation_service = ServiceFactory.get_service("Recommendation")
-                user_service = ServiceFactory.get_service("User")
+                songs = await _recommend_within_deadline(token, traits, token_task, cid)
+            if songs is not None:
                 song_service = ServiceFactory.get_service("Song")
-                spotify_token = user_service.get_spotify_token(user_id, token, cid)
-                songs = recommendation_service.get_recommendations(token, spotify_token, traits, cid)
                 logger.debug(f"Got song recommendations: {songs} - [{cid}]")  
                 logger.debug(f"Adding new songs to db: {traits} - [{cid}]")
-                song_service.add_songs(token, songs, cid)
-                logger.debug(f"Added new songs to db: {traits} - [{cid}]")
-                response_data = WebChat(
+                await song_service.save_songs(token, songs, cid)
+                response_data = _web_chat_response(
                     content=chat_message,
                     songs=songs,
                     chat_id=chat_id
                 )
             else:
-                response_data = WebChat(
+                response_data = _web_chat_response(
                     content=chat_message,
                     songs=None,
                     chat_id=chat_id
@@ -92,6 +175,85 @@ async def general_chat(request: Request) -> WebChat:
             raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse(event: str, data) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/chats/stream", tags=["chats"], status_code=status.HTTP_200_OK)
+async def general_chat_stream(request: Request) -> StreamingResponse:
+    """Streaming variant of /chats using server-sent events
+
+    Emits a `chat` event with the agent's reply as soon as it is available,
+    then a `songs` event once recommendations are ready (only when the agent
+    returned traits), then `done`. Failures after the stream has started are
+    reported as an `error` event carrying the status code and detail.
+    """
+    cid = correlation_id()
+    data = await request.json()
+    user_id = data.get("user_id")
+    chat_id = data.get("chat_id")
+    query = data.get("query")
+    token = data.get("token")
+
+    if chat_id is None:
+        chat_id = str(uuid.uuid4())
+
+    logger.info(f"Incoming Request - Method: POST, Path: /chats/stream - [{cid}]")
+    chat_service = ServiceFactory.get_service("Chat")
+    user_service = ServiceFactory.get_service("User")
+    chat_data = ChatData(
+        content=query,
+        role="human",
+        agent_name="Chat",
+        chat_id=chat_id,
+        user_id=user_id
+    )
+
+    if not chat_service.validate_token(token, id=user_id, scope=("/chats", "POST")):
+        raise HTTPException(status_code=401, detail="Invalid Token")
+
+    token_task = _speculate("get_spotify_token", cid, user_service.get_spotify_token(user_id, token, cid))
+
+    async def events():
+        try:
+            await chat_service.save_chat(chat_data, cid)
+            agent_response = await chat_service.general_chat(query=query, user_id=user_id, chat_id=chat_id, cid=cid)
+            if not agent_response:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Couldn't get chat response")
+
+            chat_message = agent_response.content
+            yield _sse("chat", {"content": chat_message, "chat_id": chat_id})
+            await chat_service.save_chat(
+                ChatData(content=chat_message, role="ai", agent_name="Chat", chat_id=chat_id, user_id=user_id),
+                cid
+            )
+
+            songs = None
+            if agent_response.traits:
+                traits = agent_response.traits
+                logger.debug(f"Got song traits: {traits} - [{cid}]")
+                songs = await _recommend_within_deadline(token, traits, token_task, cid)
+            if songs is not None:
+                song_service = ServiceFactory.get_service("Song")
+                logger.debug(f"Got song recommendations: {songs} - [{cid}]")
+                yield _sse("songs", {"songs": songs.to_records(), "chat_id": chat_id})
+                await song_service.save_songs(token, songs, cid)
+            yield _sse("done", {"chat_id": chat_id})
+        except Exception as e:
+            logger.error(f"Chat stream failed: {e} - [{cid}]")
+            if isinstance(e, HTTPException):
+                yield _sse("error", {"status_code": e.status_code, "detail": e.detail})
+            else:
+                yield _sse("error", {"status_code": 500, "detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post(
     "/recommendations",
     tags=["recommendations"],
@@ -104,7 +266,7 @@ async def query_to_recommendations(
     token: str = Depends(oauth2_scheme),
 ) -> List[Song]:
     """Given a user query, return recommended songs"""
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
     logger.info(f"Incoming Request - Method: POST, Path: /recommendations - [{cid}]")
     chat_service = ServiceFactory.get_service("Chat")
     recommendation_service = ServiceFactory.get_service("Recommendation")
@@ -120,21 +282,21 @@ async def query_to_recommendations(
     recommendation_service = ServiceFactory.get_service("Recommendation")
     # query = Message(query=query)
     chat_data = ChatData(
-        content=query,
+        content=req.message,
         role="human",
         agent_name="Recommendation",
     )
 
     try:
-        chat_service.update_chat_database(chat_data, cid)  # Store to database
-        result = chat_service.extract_song_traits(query, cid)
+        await chat_service.save_chat(chat_data, cid)  # Store to database
+        result = await chat_service.extract_song_traits(query, cid)
         logger.debug(f"Got song traits: {result} - [{cid}]")
 
         user_service = ServiceFactory.get_service("User")
-        spotify_token = user_service.get_spotify_token(user_id, token, cid)
-        result = recommendation_service.get_recommendations(token, spotify_token, result, cid)
+        spotify_token = await user_service.get_spotify_token(user_id, token, cid)
+        result = await recommendation_service.get_recommendations(token, spotify_token, result, cid)
         logger.debug(f"Got song recommendations: {result} - [{cid}]")
-        return result
+        return _songs_response(result)
     except Exception as e:
 
         if isinstance(e, HTTPException):  # Return any error specified in the chat service
@@ -150,7 +312,7 @@ async def playlist_to_recommendations(
     token: str = Depends(oauth2_scheme)
 ) -> List[Song]:
     """Given a list of song ids, return recommended songs"""
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
 
     logger.info(f"Incoming Request - Method: GET, Path: /recommendations/playlist - [{cid}]")
 
@@ -159,10 +321,10 @@ async def playlist_to_recommendations(
 
     try:
         user_service = ServiceFactory.get_service("User")
-        spotify_token = user_service.get_spotify_token(user_id, token, cid)
-        result = recommendation_service.get_recommendations(token, spotify_token, result, cid)
+        spotify_token = await user_service.get_spotify_token(user_id, token, cid)
+        result = await recommendation_service.get_recommendations(token, spotify_token, traits, cid)
         logger.debug(f"Got song recommendations: {result} - [{cid}]")
-        return result
+        return _songs_response(result)
     except Exception as e:
         if isinstance(e, HTTPException):  # Return any error specified in the chat service
             raise e
@@ -173,19 +335,19 @@ async def playlist_to_recommendations(
 @router.get("/user_preference", tags=["preference"], status_code=status.HTTP_200_OK)
 async def get_user_preference(user_id: str, chat_id: Optional[str] = None) -> str:
     """Return user preference analysis from user's chat history"""
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
 
     logger.info(f"Incoming Request - Method: GET, Path: /user_preference - [{cid}]")
     chat_service = ServiceFactory.get_service("Chat")
 
     try:
-        result = chat_service.analyze_preference(user_id=user_id, chat_id=chat_id, cid=cid)
+        result = await chat_service.analyze_preference(user_id=user_id, chat_id=chat_id, cid=cid)
         chat_data = ChatData(
             content=result,
             role="ai",
             agent_name="Preference"
         )
-        chat_service.update_chat_database(chat_data, cid)  # Store to database
+        await chat_service.save_chat(chat_data, cid)  # Store to database
         return result
     except Exception as e:
         if isinstance(e, HTTPException):  # Return any error specified in the chat service
@@ -4,11 +4,13 @@ from typing import List, Optional
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-import uuid
 
 from app.models.user import User
 from app.models.spotify_token import SpotifyToken
+from app.models.adapters import PLAYLIST_LIST
 from app.services.service_factory import ServiceFactory
+from framework.middleware.tracing import correlation_id
+from framework.utils.json_response import adapter_response, model_response
 
 logger = logging.getLogger("uvicorn")
 router = APIRouter()
@@ -29,7 +31,7 @@ async def login(request: LoginRequest):
     The service returns a user's JWT, and this should save it to the database.
     The UI can then use the JWT for future requests.
     """
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
 
     logger.info(f"Incoming Request - Method: POST, Path: /login, Body: {request.dict()} - [{cid}]")
     auth_code = request.auth_code
@@ -37,7 +39,7 @@ async def login(request: LoginRequest):
 
     try:
 
-        user = user_service.login(auth_code, cid)
+        user = await user_service.login(auth_code, cid)
         logger.debug(f"User info received: {user} - [{cid}]")
         if not user:
             logger.error(f"Login failed for auth_code: {auth_code} - [{cid}]")
@@ -56,7 +58,7 @@ async def login(request: LoginRequest):
 @router.get("/users/{user_id}", tags=["users"])
 async def get_user(user_id: str, token: str = Depends(oauth2_scheme)):
     """Gets a User's Public Information"""
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
 
     logger.info(f"Incoming Request - Method: GET, Path: /users/me - [{cid}]")
     user_service = ServiceFactory.get_service("User")
@@ -66,14 +68,14 @@ async def get_user(user_id: str, token: str = Depends(oauth2_scheme)):
     try:
         # Get the user's information in the database
         logger.info(f"Getting user info for user_id: {user_id} - [{cid}]")
-        user = user_service.get_user(token, cid)
+        user = await user_service.get_user(token, cid)
         logger.info(f"User info: {user} - [{cid}]")
         if not user:
             logger.error(f"Failed to get user info - [{cid}]")
             raise HTTPException(status_code=400, detail="User does not use Subwoofer")
 
         logger.info(f"Response - Method: GET, Path: /users/me, Status: 200, Body: {user.dict()} - [{cid}]")
-        return user
+        return model_response(user)
 
     except Exception as e:
         logger.error(f"Failed to get user info: {str(e)} - [{cid}]")
@@ -91,21 +93,21 @@ async def get_user_playlists(user_id: str, token: str = Depends(oauth2_scheme)):
     the scenes with the latest information.
     Requires a valid JWT.
     """
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
 
     logger.info(f"Incoming Request - Method: GET, Path: /users/{user_id}/playlists - [{cid}]")
     user_service = ServiceFactory.get_service("User")
 
     try:
         # Get details from Spotify integration service
-        playlists = user_service.get_user_playlists(token, cid)
+        playlists = await user_service.get_user_playlists(token, cid)
         logger.debug(f"User playlists: {playlists} - [{cid}]")
         if not playlists:
             logger.error(f"Failed to get playlists for user {user_id} - [{cid}]")
             raise HTTPException(status_code=400, detail="User does not have any playlists")
 
         logger.info(f"Response - Method: GET, Path: /users/{user_id}/playlists, Status: 200, Body: {playlists} - [{cid}]")
-        return playlists
+        return adapter_response(PLAYLIST_LIST, playlists)
 
     except Exception as e:
         # raise nested exception instead of generic 500
@@ -121,7 +123,7 @@ async def create_playlist(user_id: str, request: CreatePlaylistRequest, token: s
     Creates a playlist in the user's Spotify account.
     Requires a valid JWT.
     """
-    cid = str(uuid.uuid4())
+    cid = correlation_id()
 
     logger.info(f"Incoming Request - Method: POST, Path: /users/{user_id}/playlists - [{cid}]")
     user_service = ServiceFactory.get_service("User")
@@ -133,7 +135,7 @@ async def create_playlist(user_id: str, request: CreatePlaylistRequest, token: s
         if len(request.song_ids) == 0:
             logger.info(f"Empty song list in playlist creation - [{cid}]")
             return
-        user_service.create_playlist(token, user_id, request.name, request.song_ids, cid)
+        await user_service.create_playlist(token, user_id, request.name, request.song_ids, cid)
         logger.info(f"Response - Method: POST, Path: /users/{user_id}/playlists, Status: 200, Body: {request} - [{cid}]")
 
     except Exception as e:
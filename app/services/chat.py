@@ -1,12 +1,17 @@
-import requests
+import asyncio
 import logging
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import os, dotenv
 
 import jwt
-from requests import Response, RequestException
+from httpx import Response, HTTPError, HTTPStatusError, TransportError
 from fastapi import HTTPException
 
+from framework.services.http_client import HttpClient, unavailable_exception
+from framework.utils.write_behind import WriteBehindBuffer
+from app.utils.query_cache import QueryCache, NormalizedQueryCache
+from app.utils import jwt_claims
+
 from app.models.chat import Message, ChatData, ChatResponse
 from app.models.song import Traits
 
@@ -15,9 +20,21 @@ JWT_SECRET = os.getenv("JWT_SECRET")
 
 class ChatService:
 
-    def __init__(self, chat_url: str, user_url: str):
+    def __init__(self, chat_url: str, user_url: str, client: HttpClient, traits_cache: Optional[QueryCache] = None,
+                 write_buffer: Optional[WriteBehindBuffer] = None):
         self.chat_url = chat_url
         self.user_url = user_url
+        self.client = client
+        self.traits_cache = traits_cache if traits_cache is not None else NormalizedQueryCache()
+        # Chat history writes are queued here and flushed by _flush_chat_updates
+        self.write_buffer = write_buffer if write_buffer is not None else WriteBehindBuffer(name="chat history")
+        self.write_buffer.flush = self._flush_chat_updates
+
+    async def startup(self):
+        await self.write_buffer.startup()
+
+    async def shutdown(self):
+        await self.write_buffer.shutdown()
 
     def validate_token(self, token: str, scope: tuple[str, str], id: Optional[str]=None) -> bool:
         """Check if a JWT token is valid
@@ -26,7 +43,7 @@ class ChatService:
         checks if the token is associated with a specific user ID.
         """
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+            payload = jwt_claims.decode(token, JWT_SECRET, ['HS256'])
             if scope and scope[1] not in payload.get('scopes').get(scope[0]):
                 return False
             if id and payload.get('sub') != id:
@@ -36,13 +53,33 @@ class ChatService:
         except jwt.InvalidTokenError:
             return False
 
-    def update_chat_database(self, chat_data: ChatData, cid: str) -> str:
+    async def save_chat(self, chat_data: ChatData, cid: str):
+        """Queue a chat history write; it is sent to the chat service in the background."""
+        await self.write_buffer.put((chat_data, cid))
+
+    async def _flush_chat_updates(self, batch: List[Tuple[ChatData, str]]):
+        # The chat service takes one message per call: keep each chat's messages
+        # in order, but write different chats concurrently
+        by_chat = {}
+        for chat_data, cid in batch:
+            by_chat.setdefault(chat_data.chat_id, []).append((chat_data, cid))
+
+        async def write_in_order(updates: List[Tuple[ChatData, str]]):
+            for chat_data, cid in updates:
+                try:
+                    await self.update_chat_database(chat_data, cid)
+                except Exception as e:
+                    logging.error(f"Dropped chat history write: {e} - [{cid}]")
+
+        await asyncio.gather(*(write_in_order(updates) for updates in by_chat.values()))
+
+    async def update_chat_database(self, chat_data: ChatData, cid: str) -> str:
         try:
             logging.info(f"Updating chat database with data: {chat_data.model_dump()} - [{cid}]")
             logging.info(f"Chat URL: {self.chat_url} - [{cid}]")
-            response = self._make_request("POST", f"{self.chat_url}/update_chat", cid, json=chat_data.model_dump())
+            response = await self._make_request("POST", f"{self.chat_url}/update_chat", cid, json=chat_data.model_dump())
             return response.text
-        except RequestException as e:
+        except HTTPError as e:
             logging.error(f"Failed to get update the message to database: {e} - [{cid}]")
             # raise nested exception instead of generic 500
             if isinstance(e, HTTPException):
@@ -50,16 +87,16 @@ class ChatService:
             raise HTTPException(status_code=500, detail=str(e))
 
 
-    def general_chat(self, query: str, user_id: str, chat_id: str, cid: str) -> ChatResponse:
+    async def general_chat(self, query: str, user_id: str, chat_id: str, cid: str) -> ChatResponse:
         try:
-            response = self._make_request("POST",
-                                          f"{self.chat_url}/general_chat",
-                                          cid,
-                                          params={"user_id": user_id, "chat_id": chat_id, "query": query}
-                                          )
-            response = ChatResponse.parse_obj(response.json())
+            response = await self._make_request("POST",
+                                                f"{self.chat_url}/general_chat",
+                                                cid,
+                                                params={"user_id": user_id, "chat_id": chat_id, "query": query}
+                                                )
+            response = ChatResponse.model_validate_json(response.content)
             return response
-        except RequestException as e:
+        except HTTPError as e:
             logging.error(f"Failed to generate chat response - [{cid}]")
             # raise nested exception instead of generic 500
             if isinstance(e, HTTPException):
@@ -67,42 +104,50 @@ class ChatService:
             raise HTTPException(status_code=500, detail=str(e))
 
 
-    def extract_song_traits(self, query: Message, cid: str) -> Traits:
+    async def extract_song_traits(self, query: Message, cid: str) -> Traits:
+        traits = self.traits_cache.get(query.query)
+        if traits is not None:
+            logging.debug(f"Traits cache hit for query {query.query} - [{cid}]")
+            return traits
         try:
-            response = self._make_request("POST", f"{self.chat_url}/extract_traits", cid, json=query.model_dump())
-            traits = Traits.parse_obj(response.json())
+            response = await self._make_request("POST", f"{self.chat_url}/extract_traits", cid, json=query.model_dump())
+            traits = Traits.model_validate_json(response.content)
+            self.traits_cache.set(query.query, traits)
             return traits
-        except RequestException as e:
+        except HTTPError as e:
             logging.error(f"Failed to get song traits from query {query}: {e} - [{cid}]")
             # raise nested exception instead of generic 500
             if isinstance(e, HTTPException):
                 raise e
             raise HTTPException(status_code=500, detail=str(e))
 
-    def analyze_preference(self, user_id: str, chat_id: str, cid: str) -> str:
+    async def analyze_preference(self, user_id: str, chat_id: str, cid: str) -> str:
         try:
-            response = self._make_request("POST",
-                                          f"{self.chat_url}/analyze_preference", cid,
-                                          params={"user_id": user_id, "chat_id": chat_id}
-                                          )
+            response = await self._make_request("POST",
+                                                f"{self.chat_url}/analyze_preference", cid,
+                                                params={"user_id": user_id, "chat_id": chat_id}
+                                                )
             # print(f"agent response: {response}")
             return response.text
-        except RequestException as e:
+        except HTTPError as e:
             logging.error(f"Failed to analyze preference for current user - [{cid}]")
             # raise nested exception instead of generic 500
             if isinstance(e, HTTPException):
                 raise e
             raise HTTPException(status_code=500, detail=str(e))
 
-    def _make_request(self, method: str, url: str, cid: str, **kwargs) -> Response:
+    async def _make_request(self, method: str, url: str, cid: str, **kwargs) -> Response:
         try:
             headers = kwargs.get('headers', {})
             headers['X-Correlation-ID'] = cid
             kwargs['headers'] = headers
             
-            response = requests.request(method, url, **kwargs)
+            response = await self.client.request(method, url, **kwargs)
             response.raise_for_status()
             return response
-        except RequestException as e:
+        except HTTPStatusError as e:
             logging.error(f"HTTP {method} request to {url} failed: {e} - [{cid}]")
             raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
+        except TransportError as e:
+            logging.error(f"HTTP {method} request to {url} failed: {e!r} - [{cid}]")
+            raise unavailable_exception(e)
@@ -1,16 +1,19 @@
 import os
 from typing import Optional, List
-import requests
 from http.client import responses
 import logging
 
 import jwt
 from pydantic import ValidationError
-from requests import Response, RequestException
+from httpx import Response, HTTPError, HTTPStatusError, TransportError
 from fastapi import HTTPException, Query
 import dotenv
 
 from app.models.playlist import Playlist, PlaylistInfo, PlaylistContent
+from app.models.adapters import PLAYLIST_INFO_LIST, validate_response
+from app.utils import jwt_claims
+from framework.services.http_client import HttpClient, unavailable_exception
+from framework.utils.ttl_cache import TTLCache
 
 dotenv.load_dotenv()
 JWT_SECRET = os.getenv('JWT_SECRET')
@@ -18,20 +21,24 @@ ALGORITHM = "HS256"
 
 class PlaylistService:
 
-    def __init__(self, spotify_adapter_url: str, user_url: str, playlist_url: str):
+    def __init__(self, spotify_adapter_url: str, user_url: str, playlist_url: str, client: HttpClient,
+                 cache: Optional[TTLCache] = None):
         self.spotify_url = spotify_adapter_url  # URL of the Spotify integration service
         self.user_url = user_url
         self.playlist_url = playlist_url
+        self.client = client
+        # Read cache keyed by (caller, "playlist" | "user_playlists", id)
+        self.cache = cache if cache is not None else TTLCache()
 
-    def validate_token(self, token: str, scope: tuple[str, str], cid: str) -> bool:
+    def validate_token(self, token: str, scope: tuple[str, str], cid: Optional[str] = None) -> bool:
         """Validate a JWT token.
 
         Also checks if the token has the required scope for the endpoint.
         Scope is of the form ("/endpoint", "METHOD").
         """
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
-            if scope and scope[1] not in payload.get("scopes").get(scope[0]):
+            payload = jwt_claims.decode(token, JWT_SECRET, [ALGORITHM])
+            if scope and scope[1] not in (payload.get("scopes") or {}).get(scope[0], ()):
                 return False
             return True
 
@@ -41,33 +48,43 @@ class PlaylistService:
     def get_playlist_spotify(self, playlist_id: str, cid: str, include_tracks: Optional[bool] = Query(False)):
         pass
 
-    def get_playlist(self, playlist_id: str, token: str, cid: str) -> PlaylistInfo:
+    async def get_playlist(self, playlist_id: str, token: str, cid: str) -> PlaylistInfo:
+        key = (self._caller(token), "playlist", playlist_id)
+        playlist = self.cache.get(key)
+        if playlist is not None:
+            return playlist
         try:
-            response = self._make_request(token, "GET", f"{self.playlist_url}/playlists/{playlist_id}", cid)
-            playlist = PlaylistInfo.parse_obj(response.json())
+            response = await self._make_request(token, "GET", f"{self.playlist_url}/playlists/{playlist_id}", cid)
+            playlist = PlaylistInfo.model_validate_json(response.content)
+            self.cache.set(key, playlist)
             return playlist
-        except RequestException as e:
+        except HTTPError as e:
             logging.error(f"Failed to get playlist of {playlist_id}: {e} - [{cid}]")
             # raise nested exception instead of generic 500
             if isinstance(e, HTTPException):
                 raise e
             raise HTTPException(status_code=500, detail=str(e))
 
-    def get_playlists(self, user_id: str, token: str, cid: str) -> List[PlaylistInfo]:
+    async def get_playlists(self, user_id: str, token: str, cid: str) -> List[PlaylistInfo]:
+        key = (self._caller(token), "user_playlists", user_id)
+        playlists = self.cache.get(key)
+        if playlists is not None:
+            return playlists
         try:
-            response = self._make_request(token, "GET", f"{self.playlist_url}/users/{user_id}/playlists", cid)
-            playlists = [PlaylistInfo.parse_obj(playlist) for playlist in response.json()]
+            response = await self._make_request(token, "GET", f"{self.playlist_url}/users/{user_id}/playlists", cid)
+            playlists = validate_response(PLAYLIST_INFO_LIST, response)
+            self.cache.set(key, playlists)
             return playlists
-        except RequestException as e:
+        except HTTPError as e:
             logging.error(f"Failed to get playlists for user {user_id}: {e} - [{cid}]")
             # raise nested exception instead of generic 500
             if isinstance(e, HTTPException):
                 raise e
             raise HTTPException(status_code=500, detail=str(e))
 
-    def update_playlist(self, playlist_id: str, playlist_info: PlaylistInfo, playlist_content: PlaylistContent, token: str, cid: str):
+    async def update_playlist(self, playlist_id: str, playlist_info: PlaylistInfo, playlist_content: PlaylistContent, token: str, cid: str):
         try:
-            response = self._make_request(
+            response = await self._make_request(
                 token,
                 "POST",
                 f"{self.playlist_url}/playlists/{playlist_id}",
@@ -77,42 +94,68 @@ class PlaylistService:
                     "playlist_content": playlist_content.model_dump(mode="json"),
                 }
             )
+            self.invalidate_playlist(playlist_id, self._caller(token))
             return response.json()
 
-        except RequestException as e:
+        except HTTPError as e:
             logging.error(f"Failed to update playlist for playlist {playlist_id}: {e} - [{cid}]")
             # raise nested exception instead of generic 500
             if isinstance(e, HTTPException):
                 raise e
             raise HTTPException(status_code=500, detail=str(e))
 
-    def delete_playlist(self, playlist_id: str, token: str, cid: str):
+    async def delete_playlist(self, playlist_id: str, token: str, cid: str):
         try:
-            response = self._make_request(token,
-                                          "DELETE",
-                                          f"{self.playlist_url}/playlists/{playlist_id}", cid)
+            response = await self._make_request(token,
+                                                "DELETE",
+                                                f"{self.playlist_url}/playlists/{playlist_id}", cid)
+            self.invalidate_playlist(playlist_id, self._caller(token))
             return response.json()
-        except RequestException as e:
+        except HTTPError as e:
             logging.error(f"Failed to delete playlist {playlist_id}: {e} - [{cid}]")
             # raise nested exception instead of generic 500
             if isinstance(e, HTTPException):
                 raise e
             raise HTTPException(status_code=500, detail=str(e))
 
-    def delete_song(self, playlist_id: str, track_id: str, token: str, cid: str):
+    async def delete_song(self, playlist_id: str, track_id: str, token: str, cid: str):
         try:
-            responses = self._make_request(token,
-                                           "DELETE",
-                                           f"{self.playlist_url}/playlists/{playlist_id}/tracks/{track_id}", cid)
+            responses = await self._make_request(token,
+                                                 "DELETE",
+                                                 f"{self.playlist_url}/playlists/{playlist_id}/tracks/{track_id}", cid)
+            self.invalidate_playlist(playlist_id, self._caller(token))
             return responses.json()
-        except RequestException as e:
+        except HTTPError as e:
             logging.error(f"Failed to delete song {track_id} for playlist {playlist_id}: {e} - [{cid}]")
             # raise nested exception instead of generic 500
             if isinstance(e, HTTPException):
                 raise e
             raise HTTPException(status_code=500, detail=str(e))
 
-    def _make_request(self, token: str, method: str, url: str, cid: str, **kwargs) -> Response:
+    def invalidate_playlist(self, playlist_id: str, user_id: Optional[str] = None):
+        """Drop cached reads that could show a playlist before a write to it.
+
+        Covers the playlist itself for every caller, any cached listing that
+        contains it, and the writing user's own listings (the playlist may be new).
+        """
+        def affected(key, value) -> bool:
+            _, kind, target = key
+            if kind == "playlist":
+                return target == playlist_id
+            # Listings hold PlaylistInfo here and Spotify-shaped Playlist in UserService
+            return target == user_id or any(getattr(p, "playlist_id", None) == playlist_id
+                                            or getattr(p, "id", None) == playlist_id for p in value)
+
+        self.cache.invalidate_where(affected)
+
+    def _caller(self, token: str) -> Optional[str]:
+        """Identity that cached reads are scoped to (the JWT subject)."""
+        try:
+            return jwt_claims.decode(token, JWT_SECRET, [ALGORITHM]).get("sub")
+        except jwt.exceptions.InvalidTokenError:
+            return None
+
+    async def _make_request(self, token: str, method: str, url: str, cid: str, **kwargs) -> Response:
         try:
             # Add the JWT to the request headers
             headers = kwargs.get('headers', {})
@@ -120,10 +163,13 @@ class PlaylistService:
             headers['X-Correlation-ID'] = cid
             kwargs['headers'] = headers
 
-            response = requests.request(method, url, **kwargs)
+            response = await self.client.request(method, url, **kwargs)
             response.raise_for_status()
             return response
 
-        except RequestException as e:
+        except HTTPStatusError as e:
             logging.error(f"HTTP {method} request to {url} failed: {e} - [{cid}]")
             raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
+        except TransportError as e:
+            logging.error(f"HTTP {method} request to {url} failed: {e!r} - [{cid}]")
+            raise unavailable_exception(e)
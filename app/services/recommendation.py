@@ -1,36 +1,98 @@
-import requests
 import logging
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from app.models.song import Song, Traits
+from app.models.song_batch import SongBatch
 from app.models.spotify_token import SpotifyToken
+from app.utils.song_ranking import SongRanker
 
-from requests import Response, RequestException
+from httpx import Response, HTTPError, HTTPStatusError, TransportError
 from fastapi import HTTPException
 
+from framework.services.http_client import HttpClient, unavailable_exception
+from framework.utils.ttl_cache import TTLCache
+
+# Quantization step for audio features that are not on a 0-1 scale; the
+# 0-1 features (energy, valence, ...) use the service's `resolution`.
+FEATURE_STEPS = {
+    "tempo": 2.0,
+    "loudness": 0.5,
+    "duration_ms": 5000,
+    "popularity": 1,
+    "key": 1,
+    "mode": 1,
+    "time_signature": 1,
+}
+
+
+def canonical_traits_key(traits: Traits, resolution: float = 0.05) -> Tuple:
+    """Hashable form of `traits` that ignores order and small numeric noise.
+
+    None fields are dropped, genre/seed lists are sorted and min/max/target
+    values are rounded to the feature's step, so traits the LLM produced as
+    target_energy=0.9 and 0.91 map to the same key.
+    """
+    key = []
+    for field, value in traits.model_dump(exclude_none=True).items():
+        if isinstance(value, list):
+            value = tuple(sorted(value))
+        elif field.startswith(("min_", "max_", "target_")) and isinstance(value, (int, float)):
+            step = FEATURE_STEPS.get(field.split("_", 1)[1], resolution)
+            value = round(round(value / step) * step, 6)
+        key.append((field, value))
+    return tuple(sorted(key))
 
 
 class RecommendationService:
 
-    def __init__(self, spotify_adapter_url: str):
+    def __init__(self, spotify_adapter_url: str, client: HttpClient,
+                 cache: Optional[TTLCache] = None, resolution: float = 0.05,
+                 ranker: Optional[SongRanker] = None):
         self.spotify_adapter_url = spotify_adapter_url
+        self.client = client
+        self.cache = cache if cache is not None else TTLCache()
+        self.resolution = resolution
+        self.ranker = ranker
+
+    async def get_recommendations(self, token: str, spotify_token: SpotifyToken, traits: Traits, cid: str) -> SongBatch:
+        key = canonical_traits_key(traits, self.resolution)
+        songs = self.cache.get(key)
+        if songs is not None:
+            logging.debug(f"Recommendation cache hit - [{cid}]")
+            return songs
+
+        if self.ranker is not None:
+            songs = self.ranker.from_pool(traits)
+            if songs is not None:
+                logging.debug(f"Recommendations served from local pool - [{cid}]")
+                self.cache.set(key, songs)
+                return songs
 
-    def get_recommendations(self, token: str, spotify_token: SpotifyToken, traits: Traits, cid: str) -> List[Song]:
         params = traits.model_dump()
         params["token"] = token
         params["spotify_access_token"] = spotify_token.access_token
+        if self.ranker is not None:
+            params["limit"] = self.ranker.fetch_limit(traits)
         try:
-            response = self._make_request(token, "GET", f"{self.spotify_adapter_url}/recommendations", cid, params=params)
-            songs = [Song.parse_obj(song) for song in response.json()]
+            response = await self._make_request(token, "GET", f"{self.spotify_adapter_url}/recommendations", cid, params=params)
+            try:
+                songs = SongBatch.from_json(response.content)
+            except ValueError as e:
+                logging.error(f"Invalid song recommendations from the Spotify adapter: {e} - [{cid}]")
+                raise HTTPException(status_code=502, detail=f"Invalid response from the Spotify adapter: {e}")
+            if self.ranker is not None:
+                self.ranker.remember(songs)
+                songs = self.ranker.rank(songs, traits)
+            self.cache.set(key, songs)
             return songs
-        except RequestException as e:
+        except HTTPError as e:
             logging.error(f"Failed to get song recommendations from traits {params}: {e} - [{cid}]")
             # raise nested exception instead of generic 500
             if isinstance(e, HTTPException):
                 raise e
             raise HTTPException(status_code=500, detail=str(e))
 
-    def _make_request(self, token: str, method: str, url: str, cid: str, **kwargs) -> Response:
+    async def _make_request(self, token: str, method: str, url: str, cid: str, **kwargs) -> Response:
         try:
             # Add the JWT to the request headers
             headers = kwargs.get('headers', {})
@@ -38,9 +100,12 @@ class RecommendationService:
             headers['X-Correlation-ID'] = cid
             kwargs['headers'] = headers
 
-            response = requests.request(method, url, **kwargs)
+            response = await self.client.request(method, url, **kwargs)
             response.raise_for_status()
             return response
-        except RequestException as e:
+        except HTTPStatusError as e:
             logging.error(f"HTTP {method} request to {url} failed: {e} - [{cid}]")
             raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
+        except TransportError as e:
+            logging.error(f"HTTP {method} request to {url} failed: {e!r} - [{cid}]")
+            raise unavailable_exception(e)
@@ -1,10 +1,23 @@
 from framework.services.service_factory import BaseServiceFactory
+from framework.services.http_client import HttpClient
+from framework.middleware.profiling import RequestProfiler
 from app.services.user import UserService
 from app.services.playlist import PlaylistService
 from app.services.chat import ChatService
 from app.services.recommendation import RecommendationService
 from app.services.song import SongService
-import dotenv, os
+from app.utils.token_cache import SpotifyTokenCache
+from app.utils.query_cache import NormalizedQueryCache
+from app.utils.song_ranking import SongRanker
+from framework.utils.refresh_scheduler import RefreshScheduler
+from framework.utils.ttl_cache import TTLCache
+from framework.utils.bloom_filter import BloomFilter
+from framework.utils.profile_store import ProfileStore
+from framework.utils.span_exporter import SpanExporter
+from framework.utils.write_behind import WriteBehindBuffer
+from framework.utils.circuit_breaker import CircuitBreaker
+from framework.utils.retry_budget import RetryBudget
+import dotenv, httpx, json, os
 
 dotenv.load_dotenv()
 spotify_url = os.getenv('SPOTIFY_URL')
@@ -13,25 +26,147 @@ chat_url = os.getenv('CHAT_URL')
 playlist_url = os.getenv('PLAYLIST_URL')
 song_url = os.getenv('SONG_URL')
 
+
 class ServiceFactory(BaseServiceFactory):
 
     def __init__(self):
         super().__init__()
 
-    @classmethod
-    def get_service(cls, service_name):
-
-        if service_name == "User":
-            result = UserService(spotify_adapter_url=spotify_url, user_url=user_url, playlist_url=playlist_url)
-        elif service_name == "Playlist":
-            result = PlaylistService(spotify_adapter_url=spotify_url, user_url=user_url, playlist_url=playlist_url)
-        elif service_name == "Chat":
-            result = ChatService(chat_url=chat_url, user_url=user_url)
-        elif service_name == "Recommendation":
-            result = RecommendationService(spotify_adapter_url=spotify_url)
-        elif service_name == "Song":
-            result = SongService(song_url=song_url)
-        else:
-            result = None
-
-        return result
+
+def write_behind_buffer(name: str) -> WriteBehindBuffer:
+    # The owning service sets the flush callback
+    return WriteBehindBuffer(
+        max_batch=int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 50)),
+        max_delay=float(os.getenv('WRITE_BEHIND_MAX_DELAY', 0.5)),
+        max_pending=int(os.getenv('WRITE_BEHIND_MAX_PENDING', 1000)),
+        drain_timeout=float(os.getenv('WRITE_BEHIND_DRAIN_TIMEOUT', 10)),
+        name=name,
+    )
+
+
+def downstream_timeout(name: str, read_default: float) -> httpx.Timeout:
+    # e.g. CHAT_READ_TIMEOUT overrides HTTP_READ_TIMEOUT for the chat service only
+    connect = float(os.getenv(f'{name}_CONNECT_TIMEOUT', os.getenv('HTTP_CONNECT_TIMEOUT', 5)))
+    read = float(os.getenv(f'{name}_READ_TIMEOUT', os.getenv('HTTP_READ_TIMEOUT', read_default)))
+    return httpx.Timeout(read, connect=connect)
+
+
+def http_client() -> HttpClient:
+    client = HttpClient(
+        max_connections=int(os.getenv('HTTP_MAX_CONNECTIONS', 100)),
+        max_keepalive_connections=int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', 20)),
+        keepalive_expiry=float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 30)),
+        coalesce=os.getenv('HTTP_COALESCE_REQUESTS', 'true').lower() == 'true',
+        timeout=downstream_timeout('HTTP', 30),
+        # Retries and hedges together stay under this share of recent requests
+        retry_budget=RetryBudget(
+            ratio=float(os.getenv('RETRY_BUDGET_RATIO', 0.1)),
+            min_per_window=int(os.getenv('RETRY_BUDGET_MIN_RETRIES', 10)),
+        ),
+        retry_backoff=float(os.getenv('HTTP_RETRY_BACKOFF', 0.05)),
+    )
+    hedged = {name.strip().upper() for name in os.getenv('HTTP_HEDGE_DOWNSTREAMS', 'user,playlist').split(',')}
+    # LLM calls through the chat service are slow; everything else should answer quickly
+    for name, url, read_default in (
+        ('SPOTIFY', spotify_url, 15),
+        ('USER', user_url, 10),
+        ('CHAT', chat_url, 60),
+        ('PLAYLIST', playlist_url, 10),
+        ('SONG', song_url, 10),
+    ):
+        if not url:
+            continue
+        client.add_downstream(
+            name.lower(), url,
+            timeout=downstream_timeout(name, read_default),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5)),
+                reset_timeout=float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30)),
+                name=name.lower(),
+            ),
+            hedge=name in hedged,
+            max_retries=int(os.getenv(f'{name}_MAX_RETRIES', os.getenv('HTTP_MAX_RETRIES', 2))),
+        )
+    return client
+
+
+# TRACE_EXPORT is a file to append OTLP/JSON lines to or an OTLP/HTTP collector URL; unset disables export.
+# Registered first so it is built first and shut down last, after the chat and
+# song write-behind buffers have drained and exported the spans of their final flushes
+ServiceFactory.register("SpanExporter", lambda: SpanExporter(
+    target=os.getenv('TRACE_EXPORT') or None,
+    service_name=os.getenv('TRACE_SERVICE_NAME', 'ui-composite'),
+    buffer=write_behind_buffer("span export"),
+))
+# Shared by every service so downstream connections are pooled and kept alive
+ServiceFactory.register("HttpClient", http_client)
+ServiceFactory.register("User", lambda: UserService(
+    spotify_adapter_url=spotify_url, user_url=user_url, playlist_url=playlist_url,
+    client=ServiceFactory.get_service("HttpClient"),
+    # GET /users/{id}/playlists is served here; share the cache the playlist write handlers invalidate
+    playlist_cache=ServiceFactory.get_service("Playlist").cache,
+    # Per-user Spotify sync state (last sync time, playlists, fingerprints)
+    sync_cache_size=int(os.getenv('USER_SYNC_CACHE_SIZE', 10000)),
+    sync_cache_ttl=float(os.getenv('USER_SYNC_CACHE_TTL', 86400)),
+    # Spotify tokens are refreshed this many seconds before they expire
+    token_cache=SpotifyTokenCache(refresh_margin=float(os.getenv('SPOTIFY_TOKEN_REFRESH_MARGIN', 60))),
+    playlist_refresher=RefreshScheduler(
+        workers=int(os.getenv('PLAYLIST_REFRESH_WORKERS', 4)),
+        max_queue=int(os.getenv('PLAYLIST_REFRESH_QUEUE', 1000)),
+        jitter=float(os.getenv('PLAYLIST_REFRESH_JITTER', 1.0)),
+        name="playlist refresh",
+    ),
+))
+ServiceFactory.register("Playlist", lambda: PlaylistService(
+    spotify_adapter_url=spotify_url, user_url=user_url, playlist_url=playlist_url,
+    client=ServiceFactory.get_service("HttpClient"),
+    cache=TTLCache(
+        maxsize=int(os.getenv('PLAYLIST_CACHE_SIZE', 1024)),
+        ttl=float(os.getenv('PLAYLIST_CACHE_TTL', 60)),
+    ),
+))
+ServiceFactory.register("Chat", lambda: ChatService(
+    chat_url=chat_url, user_url=user_url,
+    client=ServiceFactory.get_service("HttpClient"),
+    traits_cache=NormalizedQueryCache(
+        maxsize=int(os.getenv('TRAITS_CACHE_SIZE', 1024)),
+        ttl=float(os.getenv('TRAITS_CACHE_TTL', 3600)),
+        strip_stop_words=os.getenv('TRAITS_CACHE_STRIP_STOP_WORDS', 'false').lower() == 'true',
+    ),
+    write_buffer=write_behind_buffer("chat history"),
+))
+ServiceFactory.register("Recommendation", lambda: RecommendationService(
+    spotify_adapter_url=spotify_url,
+    client=ServiceFactory.get_service("HttpClient"),
+    cache=TTLCache(
+        maxsize=int(os.getenv('RECOMMENDATION_CACHE_SIZE', 2048)),
+        ttl=float(os.getenv('RECOMMENDATION_CACHE_TTL', 600)),
+    ),
+    resolution=float(os.getenv('RECOMMENDATION_CACHE_RESOLUTION', 0.05)),
+    ranker=SongRanker(
+        overfetch=int(os.getenv('RECOMMENDATION_OVERFETCH', 3)),
+        weights=json.loads(os.getenv('RECOMMENDATION_FEATURE_WEIGHTS', '{}')),
+        pool_size=int(os.getenv('RECOMMENDATION_POOL_SIZE', 0)),
+        pool_max_distance=float(os.getenv('RECOMMENDATION_POOL_MAX_DISTANCE', 0.1)),
+    ) if os.getenv('RECOMMENDATION_RERANK', 'false').lower() == 'true' else None,
+))
+ServiceFactory.register("Song", lambda: SongService(
+    song_url=song_url,
+    client=ServiceFactory.get_service("HttpClient"),
+    known_tracks=BloomFilter(
+        capacity=int(os.getenv('KNOWN_TRACKS_CAPACITY', 1_000_000)),
+        error_rate=float(os.getenv('KNOWN_TRACKS_ERROR_RATE', 0.001)),
+    ),
+    snapshot_path=os.getenv('KNOWN_TRACKS_SNAPSHOT'),
+    write_buffer=write_behind_buffer("songs"),
+))
+# Profiling is off unless PROFILE_KEY is set; see framework.middleware.profiling
+ServiceFactory.register("Profiler", lambda: RequestProfiler(
+    store=ProfileStore(
+        directory=os.getenv('PROFILE_DIR', 'profiles'),
+        max_profiles=int(os.getenv('PROFILE_MAX_PROFILES', 50)),
+    ),
+    key=os.getenv('PROFILE_KEY') or None,
+    sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+    route_prefix=os.getenv('PROFILE_ROUTE_PREFIX', '/'),
+))
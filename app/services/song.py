@@ -1,24 +1,62 @@
 import os
-from typing import Optional, List
-import requests
+from typing import Optional, List, Tuple, Union
 from http.client import responses
 import logging
 
 import jwt
 from pydantic import ValidationError
-from requests import Response, RequestException
+from httpx import Response, HTTPError, HTTPStatusError, TransportError
 from fastapi import HTTPException, Query
 import dotenv
 
 from app.models.song import Song
+from app.models.song_batch import SongBatch
+from app.utils import jwt_claims
+from framework.services.http_client import HttpClient, unavailable_exception
+from framework.utils.bloom_filter import BloomFilter
+from framework.utils.write_behind import WriteBehindBuffer
 
 dotenv.load_dotenv()
 JWT_SECRET = os.getenv('JWT_SECRET')
 ALGORITHM = "HS256"
 
 class SongService:
-    def __init__(self, song_url: str):
+    def __init__(self, song_url: str, client: HttpClient, known_tracks: Optional[BloomFilter] = None,
+                 snapshot_path: Optional[str] = None, write_buffer: Optional[WriteBehindBuffer] = None):
         self.song_url = song_url
+        self.client = client
+        self.known_tracks = known_tracks if known_tracks is not None else BloomFilter()  # track_ids already stored
+        self.snapshot_path = snapshot_path  # where known_tracks is kept across restarts
+        self.songs_seen = 0
+        self.songs_filtered = 0
+        # Song inserts are queued here and flushed by _flush_songs
+        self.write_buffer = write_buffer if write_buffer is not None else WriteBehindBuffer(name="songs")
+        self.write_buffer.flush = self._flush_songs
+
+    async def startup(self):
+        await self.write_buffer.startup()
+        if self.snapshot_path:
+            known_tracks = BloomFilter.load(self.snapshot_path)
+            if known_tracks is not None:
+                self.known_tracks = known_tracks
+                logging.info(f"Loaded {len(known_tracks)} known tracks from {self.snapshot_path}")
+
+    async def shutdown(self):
+        await self.write_buffer.shutdown()
+        if self.snapshot_path:
+            try:
+                self.known_tracks.save(self.snapshot_path)
+            except OSError as e:
+                logging.error(f"Failed to save known tracks to {self.snapshot_path}: {e}")
+
+    def filter_stats(self) -> dict:
+        return {
+            "songs_seen": self.songs_seen,
+            "songs_filtered": self.songs_filtered,
+            "filtered_ratio": self.songs_filtered / self.songs_seen if self.songs_seen else 0.0,
+            "known_tracks": len(self.known_tracks),
+            "estimated_false_positive_rate": self.known_tracks.estimated_false_positive_rate(),
+        }
 
     def validate_token(self, token: str, scope: tuple[str, str]) -> bool:
         """Validate a JWT token.
@@ -27,7 +65,7 @@ class SongService:
         Scope is of the form ("/endpoint", "METHOD").
         """
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
+            payload = jwt_claims.decode(token, JWT_SECRET, [ALGORITHM])
             if scope and scope[1] not in payload.get("scopes").get(scope[0]):
                 return False
             return True
@@ -35,18 +73,56 @@ class SongService:
         except jwt.exceptions.InvalidTokenError:
             return False
 
-    def add_songs(self, token: str, song: List[Song], cid: str):
+    async def save_songs(self, token: str, song: Union[SongBatch, List[Song]], cid: str):
+        """Queue songs to be stored; they are sent to the song service in the background."""
+        await self.write_buffer.put((token, song, cid))
+
+    async def _flush_songs(self, batch: List[Tuple[str, Union[SongBatch, List[Song]], str]]):
+        # One POST per caller token, so every write still carries its own credentials
+        by_token = {}
+        for token, song, cid in batch:
+            if not isinstance(song, SongBatch):
+                song = SongBatch.from_songs(song)
+            by_token.setdefault(token, (cid, []))[1].append(song)
+        for token, (cid, songs) in by_token.items():
+            song = SongBatch.concat(songs)
+            try:
+                await self.add_songs(token, song, cid)
+            except Exception as e:
+                logging.error(f"Dropped {len(song)} song writes: {e} - [{cid}]")
+
+    async def add_songs(self, token: str, song: Union[SongBatch, List[Song]], cid: str):
+        if not isinstance(song, SongBatch):
+            song = SongBatch.from_songs(song)
+
+        # Only send tracks we have not stored before (a Bloom filter, so rarely a new one is skipped)
+        keep, new_ids = [], set()
+        for i, track_id in enumerate(song.track_ids):
+            if track_id is None or (track_id not in self.known_tracks and track_id not in new_ids):
+                keep.append(i)
+                new_ids.add(track_id)
+        self.songs_seen += len(song)
+        self.songs_filtered += len(song) - len(keep)
+        if not keep:
+            logging.debug(f"All {len(song)} songs already stored - [{cid}]")
+            return None
+        new_songs = song.take(keep) if len(keep) < len(song) else song
+
         try:
-            response = self._make_request(token, "POST", f"{self.song_url}/songs", cid, json=[s.model_dump() for s in song])
+            response = await self._make_request(token, "POST", f"{self.song_url}/songs", cid, content=new_songs.to_json(),
+                                                headers={"Content-Type": "application/json"})
+            for track_id in new_ids:
+                if track_id is not None:
+                    self.known_tracks.add(track_id)
             return response.json()
-        except RequestException as e:
+        except HTTPError as e:
             logging.error(f"Failed to put song {song}: {e} - [{cid}]")
             # raise nested exception instead of generic 500
             if isinstance(e, HTTPException):
                 raise e
             raise HTTPException(status_code=500, detail=str(e))
 
-    def _make_request(self, token: str, method: str, url: str, cid: str, **kwargs) -> Response:
+    async def _make_request(self, token: str, method: str, url: str, cid: str, **kwargs) -> Response:
         try:
             # Add the JWT to the request headers
             headers = kwargs.get('headers', {})
@@ -54,10 +130,13 @@ class SongService:
             headers['X-Correlation-ID'] = cid
             kwargs['headers'] = headers
 
-            response = requests.request(method, url, **kwargs)
+            response = await self.client.request(method, url, **kwargs)
             response.raise_for_status()
             return response
 
-        except RequestException as e:
+        except HTTPStatusError as e:
             logging.error(f"HTTP {method} request to {url} failed: {e} - [{cid}]")
             raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
+        except TransportError as e:
+            logging.error(f"HTTP {method} request to {url} failed: {e!r} - [{cid}]")
+            raise unavailable_exception(e)
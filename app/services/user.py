@@ -1,47 +1,95 @@
 import os
-import requests
+import asyncio
 import logging
 from typing import List, Optional
 import time
 
-from pydantic import ValidationError, parse_obj_as
+from pydantic import ValidationError
 import jwt
 
 from app.models.user import User
 from app.models.playlist import Playlist
+from app.models.adapters import PLAYLIST_LIST, validate_response
 from app.models.spotify_token import SpotifyToken
 
-from requests import Response, RequestException
+import httpx
 import dotenv
+from fastapi import HTTPException
+
+from framework.middleware import deadline
+from framework.services.http_client import HttpClient, unavailable_exception
+from framework.utils.refresh_scheduler import RefreshScheduler
+from framework.utils.ttl_cache import TTLCache
+from app.utils.token_cache import SpotifyTokenCache
+from app.utils.playlist_sync import diff_playlists
+from app.utils import jwt_claims
 
 dotenv.load_dotenv()
 UPDATE_FREQUENCY = 300  # seconds -> 5 minutes
+SYNC_CONCURRENCY = int(os.getenv("PLAYLIST_SYNC_CONCURRENCY", 8))  # parallel POSTs to the playlist service
 JWT_SECRET = os.getenv("JWT_SECRET")
 
 
+class PlaylistSyncError(Exception):
+    """A Spotify playlist sync could not run (e.g. no Spotify token for the user)."""
+
+
+def _raise_server_error(e: httpx.HTTPStatusError):
+    """Pass a downstream 5xx on; only a 4xx means the user or data is missing."""
+    if e.response.status_code >= 500:
+        raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
+
+
 class UserService:
 
-    def __init__(self, spotify_adapter_url: str, user_url: str, playlist_url: str):
+    def __init__(self, spotify_adapter_url: str, user_url: str, playlist_url: str, client: HttpClient,
+                 token_cache: SpotifyTokenCache, playlist_refresher: Optional[RefreshScheduler] = None,
+                 playlist_cache: Optional[TTLCache] = None, sync_cache_size: int = 10000,
+                 sync_cache_ttl: float = 86400):
         self.spotify_url = spotify_adapter_url  # URL of the Spotify integration service
         self.user_url = user_url
         self.playlist_url = playlist_url
-        self.last_updated = {}
-
-    def login(self, auth_code: str, cid: str) -> Optional[User]:
+        self.client = client
+        self.token_cache = token_cache
+        # Per-user sync state, bounded so it does not grow with every user ever seen. Losing an
+        # entry only means an earlier sync, or a full push instead of only the changed playlists.
+        self.last_updated = TTLCache(maxsize=sync_cache_size, ttl=sync_cache_ttl)
+        self.playlist_fingerprints = TTLCache(maxsize=sync_cache_size, ttl=sync_cache_ttl)  # user_id -> {playlist_id: fingerprint} as last pushed
+        self.synced_playlists = TTLCache(maxsize=sync_cache_size, ttl=sync_cache_ttl)  # user_id -> playlists from the last Spotify sync
+        self.playlist_refresher = playlist_refresher or RefreshScheduler(name="playlist refresh")
+        self._background_writes = set()  # keeps fire-and-forget writes alive until they complete
+        # Shared with PlaylistService, whose write handlers invalidate it; keyed (user, "spotify_playlists", user)
+        self.playlist_cache = playlist_cache if playlist_cache is not None else TTLCache()
+
+    async def startup(self):
+        await self.playlist_refresher.startup()
+
+    async def shutdown(self):
+        await self.playlist_refresher.shutdown()
+        # Let pending write-backs reach the user service before the client closes
+        if self._background_writes:
+            await asyncio.gather(*self._background_writes, return_exceptions=True)
+
+    async def login(self, auth_code: str, cid: str) -> Optional[User]:
         payload = {'auth_code': auth_code}
 
         try:
             # Exchange the auth code for user info from the Spotify integration service
-            response = self._make_request('POST', f"{self.spotify_url}/auth/login", token="", cid=cid, json=payload)
+            response = await self._make_request('POST', f"{self.spotify_url}/auth/login", token="", cid=cid, json=payload)
             data = response.json()
 
             # Update the user in the User service
-            updated_response = self._make_request('POST', f"{self.user_url}/users", token="", cid=cid, json=data)
+            updated_response = await self._make_request('POST', f"{self.user_url}/users", token="", cid=cid, json=data)
             user = User.parse_obj(updated_response.json().get('user'))
             return user
 
-        except requests.RequestException as e:
+        except httpx.TransportError as e:
+            logging.error(f"Login failed for auth_code {auth_code}: {e!r} - [{cid}]")
+            raise unavailable_exception(e)
+
+        except httpx.HTTPStatusError as e:
             logging.error(f"Login failed for auth_code {auth_code}: {e} - [{cid}]")
+            _raise_server_error(e)
             return None
 
         except ValidationError as e:
@@ -55,7 +103,7 @@ class UserService:
         checks if the token is associated with a specific user ID.
         """
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+            payload = jwt_claims.decode(token, JWT_SECRET, ['HS256'])
             if scope[1] not in payload.get('scopes').get(scope[0]):
                 return False
             if id and payload.get('sub') != id:
@@ -65,16 +113,19 @@ class UserService:
         except jwt.InvalidTokenError as e:
             return False
 
-    def get_user_id(self, token: str, cid: str) -> Optional[str]:
+    def get_claims(self, token: str, cid: str) -> Optional[dict]:
         try:
-            # Decode the JWT to get the user ID
-            payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-            return payload.get('sub')
+            return jwt_claims.decode(token, JWT_SECRET, ['HS256'])
 
         except jwt.InvalidTokenError:
             logging.error(f"Invalid JWT: {token} - [{cid}]")
 
-    def get_user(self, token: str, cid: str) -> Optional[User]:
+    def get_user_id(self, token: str, cid: str) -> Optional[str]:
+        # Decode the JWT to get the user ID
+        payload = self.get_claims(token, cid)
+        return payload.get('sub') if payload else None
+
+    async def get_user(self, token: str, cid: str) -> Optional[User]:
         user_id = self.get_user_id(token, cid)
         print(f"User Id from token: {user_id}")
         if not user_id:
@@ -82,12 +133,17 @@ class UserService:
 
         try:
             # Retrieve user info from the User service
-            response = self._make_request('GET', f"{self.user_url}/users/{user_id}", token, cid)
-            user = User.parse_obj(response.json())
+            response = await self._make_request('GET', f"{self.user_url}/users/{user_id}", token, cid)
+            user = User.model_validate_json(response.content)
             return user
 
-        except requests.RequestException as e:
+        except httpx.TransportError as e:
+            logging.error(f"Failed to get user {user_id}: {e!r} - [{cid}]")
+            raise unavailable_exception(e)
+
+        except httpx.HTTPStatusError as e:
             logging.error(f"Failed to get user {user_id}: {e} - [{cid}]")
+            _raise_server_error(e)
             return None
 
         except Exception as e:
@@ -95,92 +151,184 @@ class UserService:
             return None
 
 
-    def get_user_playlists(self, token: str, cid: str) -> Optional[List[Playlist]]:
+    async def get_user_playlists(self, token: str, cid: str) -> Optional[List[Playlist]]:
 
         user_id = self.get_user_id(token, cid)
         if not user_id or not self.validate_token(token, ("/users/{user_id}/playlists", "GET"), user_id):
             return None
 
-        if self._should_update(user_id):
-            playlists = self._update_playlists_from_spotify(user_id, token, cid)
-        else:
-            playlists = self._get_playlists_from_service(user_id, token, cid)
+        # Answer from what we already have; a stale user gets a background Spotify sync
+        playlists = await self._get_playlists_from_service(user_id, token, cid)
+        if not playlists:
+            playlists = self.synced_playlists.get(user_id)
+
+        if self._should_update(user_id, cid):
+            if not playlists and not self.playlist_refresher.is_pending(user_id):
+                # Nothing to show yet, so this request has to wait for the sync
+                try:
+                    return await self._update_playlists_from_spotify(user_id, token, cid)
+                except httpx.TransportError as e:
+                    raise unavailable_exception(e)
+                except httpx.HTTPStatusError as e:
+                    _raise_server_error(e)
+                    return None
+                except (PlaylistSyncError, ValidationError):
+                    return None
+            self.playlist_refresher.schedule(user_id, lambda: self._update_playlists_from_spotify(user_id, token, cid))
         return playlists
 
-    def create_playlist(self, token: str, user_id: str, name: str, song_ids: List[str], cid: str):
+    async def create_playlist(self, token: str, user_id: str, name: str, song_ids: List[str], cid: str):
 
         # Create Playlist in Spotify Adapter
         try:
-            spotify_token = self.get_spotify_token(user_id, token, cid)
+            spotify_token = await self.get_spotify_token(user_id, token, cid)
             payload = {
                 "token": spotify_token.model_dump(),
                 "name": name,
                 "song_ids": song_ids
             }
-            response = self._make_request('POST', f"{self.spotify_url}/users/{user_id}/playlists", token, cid, json=payload)
+            response = await self._make_request('POST', f"{self.spotify_url}/users/{user_id}/playlists", token, cid, json=payload)
 
         except Exception as e:
             logging.error(f"Failed to create playlist: {e} - [{cid}]")
             raise e
 
-    def get_spotify_token(self, user_id: str, token: str, cid: str) -> Optional[SpotifyToken]:
+    async def get_spotify_token(self, user_id: str, token: str, cid: str) -> Optional[SpotifyToken]:
         try:
-            # Get spotify token
-            response = self._make_request('GET', f"{self.user_url}/users/{user_id}/spotify_token", token, cid)
-            spotify_token = SpotifyToken.parse_obj(response.json())
-            # TODO: shouldn't need to refresh every time
-            # Refresh token
-            params = spotify_token.model_dump()
-            params["token"] = token
-            response = self._make_request('GET', f"{self.spotify_url}/users/{user_id}/refreshed_token", token, cid, params=params)
-            spotify_token = SpotifyToken.parse_obj(response.json())
-            # Update token in user database
-            params = spotify_token.model_dump()
-            params["token"] = token
-            self._make_request('PUT', f"{self.user_url}/users/{user_id}/spotify_token", token, cid, json=params)
-            return spotify_token
-        except requests.RequestException as e:
+            if self.get_user_id(token, cid) != user_id:
+                # Only share cached tokens with their owner; anything else goes to the user service
+                return await self._refresh_spotify_token(user_id, token, cid)
+            return await self.token_cache.get_or_refresh(
+                user_id, lambda: self._refresh_cached_spotify_token(user_id, token, cid)
+            )
+        except httpx.TransportError as e:
+            # Callers cannot do anything useful without a token; fail fast with 503/504
+            logging.error(f"Failed to get Spotify token for {user_id}: {e!r} - [{cid}]")
+            raise unavailable_exception(e)
+        except httpx.HTTPError as e:
             logging.error(f"Failed to get Spotify token for {user_id}: {e} - [{cid}]")
             return None
 
+    async def _refresh_cached_spotify_token(self, user_id: str, token: str, cid: str) -> SpotifyToken:
+        cached = self.token_cache.peek(user_id)
+        if cached is not None:
+            try:
+                return await self._refresh_spotify_token(user_id, token, cid, cached)
+            except httpx.HTTPStatusError as e:
+                # The cached refresh_token was revoked or rotated; start over from the user service's copy
+                logging.warning(f"Cached Spotify refresh token for {user_id} rejected: {e} - [{cid}]")
+                self.token_cache.invalidate(user_id)
+        return await self._refresh_spotify_token(user_id, token, cid)
+
+    async def _refresh_spotify_token(self, user_id: str, token: str, cid: str,
+                                     spotify_token: Optional[SpotifyToken] = None) -> SpotifyToken:
+        # Reuse an expired token's refresh_token if we hold one; otherwise ask the user service
+        if spotify_token is None:
+            response = await self._make_request('GET', f"{self.user_url}/users/{user_id}/spotify_token", token, cid)
+            spotify_token = SpotifyToken.model_validate_json(response.content)
+
+        # Refresh token
+        params = spotify_token.model_dump()
+        params["token"] = token
+        response = await self._make_request('GET', f"{self.spotify_url}/users/{user_id}/refreshed_token", token, cid, params=params)
+        spotify_token = SpotifyToken.model_validate_json(response.content)
+
+        # Update token in user database without holding up the caller
+        params = spotify_token.model_dump()
+        params["token"] = token
+        task = asyncio.create_task(self._store_spotify_token(user_id, params, token, cid))
+        self._background_writes.add(task)
+        task.add_done_callback(self._background_writes.discard)
+        return spotify_token
+
+    async def _store_spotify_token(self, user_id: str, params: dict, token: str, cid: str):
+        # Runs detached from the request that refreshed the token; its deadline does not apply
+        deadline.clear()
+        try:
+            await self._make_request('PUT', f"{self.user_url}/users/{user_id}/spotify_token", token, cid, json=params)
+        except httpx.HTTPError as e:
+            logging.error(f"Failed to store refreshed Spotify token for {user_id}: {e} - [{cid}]")
+
     def _should_update(self, user_id: str, cid: str) -> bool:
         last_time = self.last_updated.get(user_id, 0)
         return (time.time() - last_time) >= UPDATE_FREQUENCY
 
-    def _get_playlists_from_service(self, user_id: str, token: str, cid: str) -> Optional[List[Playlist]]:
+    async def _get_playlists_from_service(self, user_id: str, token: str, cid: str) -> Optional[List[Playlist]]:
+        key = (user_id, "spotify_playlists", user_id)
+        playlists = self.playlist_cache.get(key)
+        if playlists is not None:
+            return playlists
         try:
-            response = self._make_request('GET', f"{self.playlist_url}/users/{user_id}/playlists", token, cid)
-            playlists = parse_obj_as(List[Playlist], response.json())
+            response = await self._make_request('GET', f"{self.playlist_url}/users/{user_id}/playlists", token, cid)
+            playlists = validate_response(PLAYLIST_LIST, response)
+            self.playlist_cache.set(key, playlists)
             return playlists
-        except requests.RequestException as e:
+        except httpx.TransportError as e:
+            logging.error(f"Failed to get cached playlists for {user_id}: {e!r} - [{cid}]")
+            raise unavailable_exception(e)
+        except httpx.HTTPStatusError as e:
             logging.error(f"Failed to get cached playlists for {user_id}: {e} - [{cid}]")
+            _raise_server_error(e)
             return None
 
-    def _update_playlists_from_spotify(self, user_id: str, token: str, cid: str) -> Optional[List[Playlist]]:
+    async def _update_playlists_from_spotify(self, user_id: str, token: str, cid: str) -> List[Playlist]:
+        """Sync the user's playlists from Spotify; raises on failure so the refresh scheduler counts it."""
         try:
             logging.info(f"Updating playlists from Spotify for user {user_id} - [{cid}]")
 
             # Get the user's spotify token from user service
-            spotify_token = self.get_spotify_token(user_id, token, cid)
+            spotify_token = await self.get_spotify_token(user_id, token, cid)
+            if spotify_token is None:
+                raise PlaylistSyncError(f"No Spotify token for user {user_id}")
 
             # Get the user's playlists from the playlist service
-            payload = {"spotify_token": spotify_token}
-            response = self._make_request('GET', f"{self.spotify_url}/users/{user_id}/playlists", token, cid, json=payload)
+            payload = {"spotify_token": spotify_token.model_dump()}
+            response = await self._make_request('GET', f"{self.spotify_url}/users/{user_id}/playlists", token, cid, json=payload)
             spotify_playlists = response.json()
 
-            # Update the playlist service with new data
-            for playlist in spotify_playlists:
-                playlist_id = playlist.get('id')
-                self._make_request('POST', f"{self.playlist_url}/playlists/{playlist_id}", token, cid, json=spotify_playlists)
+            # Update the playlist service with the playlists that changed since the last sync
+            try:
+                await self._push_changed_playlists(user_id, spotify_playlists, token, cid)
+            finally:
+                # Even a partial push can change what the playlist service lists
+                self.playlist_cache.pop((user_id, "spotify_playlists", user_id))
 
-            playlists = parse_obj_as(List[Playlist], spotify_playlists)
-            self.last_updated[user_id] = time.time()
+            playlists = PLAYLIST_LIST.validate_python(spotify_playlists)
+            self.synced_playlists.set(user_id, playlists)
+            self.last_updated.set(user_id, time.time())
             return playlists
-        except requests.RequestException as e:
+        except (httpx.HTTPError, PlaylistSyncError, ValidationError) as e:
             logging.error(f"Failed to update playlists from Spotify for {user_id}: {e} - [{cid}]")
-            return None
+            raise
+
+    async def _push_changed_playlists(self, user_id: str, spotify_playlists: List[dict], token: str, cid: str):
+        synced = self.playlist_fingerprints.get(user_id)
+        if synced is None:
+            synced = {}
+            self.playlist_fingerprints.set(user_id, synced)
+        changed = diff_playlists(spotify_playlists, synced)
+        logging.info(f"Syncing {len(changed)} of {len(spotify_playlists)} playlists for user {user_id} - [{cid}]")
+        if not changed:
+            return
 
-    def _make_request(self, method: str, url: str, token:str, cid: str, **kwargs) -> requests.Response:
+        semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+
+        async def push(playlist: dict):
+            async with semaphore:
+                playlist_id = playlist.get('id')
+                await self._make_request('POST', f"{self.playlist_url}/playlists/{playlist_id}", token, cid, json=playlist)
+                synced[playlist_id] = changed[playlist_id]
+
+        results = await asyncio.gather(
+            *(push(playlist) for playlist in spotify_playlists if playlist.get('id') in changed),
+            return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            # Failed playlists keep their old fingerprint and are retried on the next sync
+            raise errors[0]
+
+    async def _make_request(self, method: str, url: str, token:str, cid: str, **kwargs) -> httpx.Response:
         try:
             # Add the JWT to the request headers
             if token:
@@ -189,9 +337,9 @@ class UserService:
                 headers['X-Correlation-ID'] = cid
                 kwargs['headers'] = headers
 
-            response = requests.request(method, url, **kwargs)
+            response = await self.client.request(method, url, **kwargs)
             response.raise_for_status()
             return response
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             logging.error(f"HTTP {method} request to {url} failed: {e} - [{cid}]")
             raise
@@ -0,0 +1,25 @@
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+import jwt
+
+# Claims of a token that was already verified higher up the same request, e.g.
+# by POST /batch for all of its sub-requests. Sub-requests run in tasks copied
+# from the batch handler's context, so they see it; nothing else does.
+_verified: ContextVar[Optional[Tuple[str, dict]]] = ContextVar("verified_jwt", default=None)
+
+
+def decode(token: str, secret: str, algorithms: List[str]) -> dict:
+    """jwt.decode, skipped when this exact token was already verified in this context
+
+    Raises jwt.InvalidTokenError like jwt.decode does.
+    """
+    verified = _verified.get()
+    if verified is not None and verified[0] == token:
+        return verified[1]
+    return jwt.decode(token, secret, algorithms=algorithms)
+
+
+def verified(token: str, claims: dict):
+    """Let calls made from the current context reuse `claims` for `token`"""
+    _verified.set((token, claims))
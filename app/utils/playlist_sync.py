@@ -0,0 +1,20 @@
+import hashlib
+import json
+from typing import Dict, List
+
+
+def playlist_fingerprint(playlist: dict) -> str:
+    """Stable hash of a Spotify playlist (name, snapshot/branch, tracks, ...)."""
+    encoded = json.dumps(playlist, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(encoded.encode()).hexdigest()
+
+
+def diff_playlists(playlists: List[dict], previous: Dict[str, str]) -> Dict[str, str]:
+    """Return {playlist_id: fingerprint} for playlists that changed since `previous`."""
+    changed = {}
+    for playlist in playlists:
+        fingerprint = playlist_fingerprint(playlist)
+        playlist_id = playlist.get("id")
+        if previous.get(playlist_id) != fingerprint:
+            changed[playlist_id] = fingerprint
+    return changed
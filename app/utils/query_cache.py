@@ -0,0 +1,66 @@
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+from framework.utils.ttl_cache import TTLCache
+
+# Words that do not change what music the user is asking for. Negations
+# ("no", "not", "without") are deliberately absent.
+STOP_WORDS = frozenset({
+    "a", "an", "the", "some", "any", "me", "i", "i'm", "im", "my", "we", "us", "you",
+    "please", "pls", "can", "could", "would", "give", "play", "find", "recommend",
+    "want", "like", "need", "for", "to", "of", "and", "or", "in", "on", "that", "this",
+    "is", "are", "be", "just", "really", "very", "something",
+})
+
+_PUNCTUATION = re.compile(r"[^\w\s']+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str, strip_stop_words: bool = False) -> str:
+    """Case-fold and collapse punctuation/whitespace so near-identical prompts match."""
+    text = _PUNCTUATION.sub(" ", text.casefold())
+    words = _WHITESPACE.sub(" ", text).strip().split(" ")
+    if strip_stop_words:
+        words = [w for w in words if w not in STOP_WORDS] or words
+    return " ".join(w for w in words if w)
+
+
+class QueryCache(ABC):
+    """Cache of results for natural-language queries.
+
+    Implementations decide what counts as "the same" query: exact text after
+    normalization here, or nearest neighbour in an embedding index later.
+    """
+
+    @abstractmethod
+    def get(self, query: str) -> Optional[Any]:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def set(self, query: str, value: Any):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def stats(self) -> dict:
+        raise NotImplementedError()
+
+
+class NormalizedQueryCache(QueryCache):
+    """QueryCache keyed by `normalize_query`, backed by a TTL/LRU cache."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, strip_stop_words: bool = False):
+        self.strip_stop_words = strip_stop_words
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def key(self, query: str) -> str:
+        return normalize_query(query, self.strip_stop_words)
+
+    def get(self, query: str) -> Optional[Any]:
+        return self._cache.get(self.key(query))
+
+    def set(self, query: str, value: Any):
+        self._cache.set(self.key(query), value)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
@@ -0,0 +1,98 @@
+from typing import Dict, Iterable, List, Tuple
+
+from app.services.service_factory import ServiceFactory
+from framework.utils.metrics import Family
+
+
+def service_metrics() -> Iterable[Family]:
+    """Scrape-time collector for the counters the services already keep.
+
+    Only services that have been built are read; scraping never creates one.
+    """
+    services = ServiceFactory.instances()
+    yield from _cache_metrics(services)
+    yield from _client_metrics(services.get("HttpClient"))
+    yield from _queue_metrics(services)
+
+
+def _cache_metrics(services: Dict) -> Iterable[Family]:
+    caches: List[Tuple[str, dict]] = []
+    if "Playlist" in services:
+        caches.append(("playlist", services["Playlist"].cache.stats()))
+    if "Recommendation" in services:
+        recommendation = services["Recommendation"]
+        caches.append(("recommendation", recommendation.cache.stats()))
+        if recommendation.ranker is not None:
+            pool = recommendation.ranker.stats()
+            caches.append(("recommendation_pool",
+                           {"size": pool["pool_size"], "hits": pool["pool_hits"], "misses": pool["pool_misses"]}))
+    if "Chat" in services:
+        caches.append(("song_traits", services["Chat"].traits_cache.stats()))
+    if "User" in services:
+        caches.append(("spotify_token", services["User"].token_cache.stats()))
+    if "Song" in services:
+        # A "hit" is a song the known-tracks filter kept from being stored again
+        filtered = services["Song"].filter_stats()
+        caches.append(("known_tracks", {
+            "size": filtered["known_tracks"],
+            "hits": filtered["songs_filtered"],
+            "misses": filtered["songs_seen"] - filtered["songs_filtered"],
+        }))
+
+    for key, metric_type, documentation in (
+        ("hits", "counter", "Cache lookups that found a usable entry."),
+        ("misses", "counter", "Cache lookups that did not."),
+        ("evictions", "counter", "Entries evicted to stay under the cache's size limit."),
+        ("size", "gauge", "Entries currently held."),
+    ):
+        samples = [({"cache": name}, stats[key]) for name, stats in caches if key in stats]
+        name = f"cache_{key}_total" if metric_type == "counter" else f"cache_{key}"
+        yield name, metric_type, documentation, samples
+
+
+def _client_metrics(client) -> Iterable[Family]:
+    if client is None:
+        return
+    stats = client.stats()
+    yield ("downstream_coalesced_requests_total", "counter",
+           "Downstream calls answered by sharing an identical in-flight request.",
+           [({}, stats["coalesced_requests"])])
+    yield ("downstream_retries_total", "counter", "Retried downstream calls.", [({}, stats["retries"])])
+    yield ("downstream_hedged_requests_total", "counter", "Hedge attempts sent for slow downstream calls.",
+           [({}, stats["hedged_requests"])])
+    yield ("downstream_hedge_wins_total", "counter", "Hedge attempts that answered before the original.",
+           [({}, stats["hedge_wins"])])
+    yield ("downstream_retry_budget_denied_total", "counter", "Retries and hedges refused by the retry budget.",
+           [({}, stats["retry_budget"]["denied"])])
+    yield ("downstream_circuit_open", "gauge", "1 while the downstream's circuit breaker is not closed.",
+           [({"downstream": name}, int(circuit["state"] != "closed")) for name, circuit in stats["circuits"].items()])
+    yield ("downstream_circuit_trips_total", "counter", "Times the downstream's circuit breaker opened.",
+           [({"downstream": name}, circuit["trips"]) for name, circuit in stats["circuits"].items()])
+
+
+def _queue_metrics(services: Dict) -> Iterable[Family]:
+    buffers = [(name.lower(), services[name].write_buffer.stats()) for name in ("Chat", "Song") if name in services]
+    if "SpanExporter" in services:
+        buffers.append(("span_export", services["SpanExporter"].buffer.stats()))
+    yield ("write_behind_pending", "gauge", "Writes queued and not yet flushed.",
+           [({"buffer": name}, stats["pending"]) for name, stats in buffers])
+    yield ("write_behind_flushed_items_total", "counter", "Writes flushed downstream.",
+           [({"buffer": name}, stats["flushed_items"]) for name, stats in buffers])
+    yield ("write_behind_failed_batches_total", "counter", "Flushed batches that failed.",
+           [({"buffer": name}, stats["failed_batches"]) for name, stats in buffers])
+    yield ("write_behind_dropped_items_total", "counter",
+           "Writes dropped because the buffer was full or did not drain on shutdown; "
+           "for span_export, each one is a lost trace.",
+           [({"buffer": name}, stats["dropped_items"]) for name, stats in buffers])
+    if "User" in services:
+        refresh = services["User"].playlist_refresher.stats()
+        yield ("playlist_refresh_queue_depth", "gauge", "Playlist refreshes waiting for a worker.",
+               [({}, refresh["queue_depth"])])
+        yield ("playlist_refresh_dropped_total", "counter", "Playlist refreshes dropped because the queue was full.",
+               [({}, refresh["dropped"])])
+        yield ("playlist_refresh_lag_seconds", "gauge",
+               "Seconds from scheduling to completion of the most recent playlist refresh.",
+               [({}, refresh["last_lag"])])
+        yield ("playlist_refresh_oldest_pending_seconds", "gauge",
+               "Age of the oldest playlist refresh still queued or running.",
+               [({}, refresh["oldest_pending_age"])])
@@ -0,0 +1,144 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.models.song import Traits
+from app.models.song_batch import FEATURE_FIELDS, SongBatch
+
+# Traits feature name -> (SongBatch column, scale). Distances are measured in
+# units of the scale so tempo or duration do not drown out the 0-1 features.
+# time_signature has no Song column and cannot be scored locally.
+RANKED_FEATURES = {
+    "acousticness": ("acousticness", 1.0),
+    "danceability": ("danceability", 1.0),
+    "duration_ms": ("duration_ms", 300000.0),
+    "energy": ("energy", 1.0),
+    "instrumentalness": ("instrumentalness", 1.0),
+    "key": ("key", 11.0),
+    "liveness": ("liveness", 1.0),
+    "loudness": ("loudness", 60.0),
+    "mode": ("mode", 1.0),
+    "popularity": ("track_popularity", 100.0),
+    "speechiness": ("speechiness", 1.0),
+    "tempo": ("tempo", 200.0),
+    "valence": ("valence", 1.0),
+}
+
+_COLUMNS = np.array([FEATURE_FIELDS.index(column) for column, _ in RANKED_FEATURES.values()])
+_SCALES = np.array([scale for _, scale in RANKED_FEATURES.values()])
+
+# Spotify's default number of recommendations when `limit` is not given
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def traits_vectors(traits: Traits) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Target, min and max vectors over RANKED_FEATURES, NaN where unset."""
+    values = traits.model_dump()
+    vectors = []
+    for prefix in ("target", "min", "max"):
+        vectors.append(np.array(
+            [values[f"{prefix}_{name}"] for name in RANKED_FEATURES], dtype=float
+        ))
+    return tuple(vectors)
+
+
+def score_songs(songs: SongBatch, traits: Traits, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """Weighted distance of each song to the traits' targets.
+
+    Songs outside a min/max bound get +inf. A song missing a targeted feature
+    is treated as the full scale away from it. Lower is better; with no
+    targets every in-bounds song scores 0.
+    """
+    target, low, high = traits_vectors(traits)
+    x = songs.features[:, _COLUMNS]
+    if weights is None:
+        weights = np.ones(len(RANKED_FEATURES))
+
+    with np.errstate(invalid="ignore"):
+        # NaN comparisons are False, so unset bounds and missing features pass
+        # only when the bound is unset
+        in_bounds = ~((x < low) | (x > high) | (np.isnan(x) & ~(np.isnan(low) & np.isnan(high))))
+    valid = in_bounds.all(axis=1)
+
+    targeted = ~np.isnan(target)
+    diff = (x[:, targeted] - target[targeted]) / _SCALES[targeted]
+    diff = np.nan_to_num(diff, nan=1.0)
+    distance = np.sqrt((weights[targeted] * diff * diff).sum(axis=1))
+    return np.where(valid, distance, np.inf)
+
+
+def requested_limit(traits: Traits) -> int:
+    return traits.limit if traits.limit is not None else DEFAULT_LIMIT
+
+
+class SongRanker:
+    """Re-rank recommendation candidates locally against a Traits target.
+
+    Asks the adapter for `overfetch` times the requested number of songs and
+    keeps the closest `limit` of them. With a `pool_size`, songs from earlier
+    responses are kept (deduplicated by track id) and a later query is served
+    straight from the pool when it holds `limit` in-bound songs all within
+    `pool_max_distance` of the target.
+    """
+
+    def __init__(self, overfetch: int = 3, weights: Optional[Dict[str, float]] = None,
+                 pool_size: int = 0, pool_max_distance: float = 0.1):
+        self.overfetch = overfetch
+        self.weights = np.array([(weights or {}).get(name, 1.0) for name in RANKED_FEATURES])
+        self.pool_size = pool_size
+        self.pool_max_distance = pool_max_distance
+        self.pool = SongBatch.empty()
+        self._pool_ids = set()
+        self.pool_hits = 0
+        self.pool_misses = 0
+
+    def fetch_limit(self, traits: Traits) -> int:
+        return min(requested_limit(traits) * self.overfetch, MAX_LIMIT)
+
+    def rank(self, songs: SongBatch, traits: Traits) -> SongBatch:
+        """Closest `limit` songs, best first; ties keep the adapter's order."""
+        scores = score_songs(songs, traits, self.weights)
+        order = np.argsort(scores, kind="stable")
+        order = order[np.isfinite(scores[order])][:requested_limit(traits)]
+        return songs.take(order.tolist())
+
+    def from_pool(self, traits: Traits) -> Optional[SongBatch]:
+        """Serve `traits` from previously seen songs, or None if the pool is not good enough."""
+        # Seeds and genres are matched by the adapter, not by audio features
+        if not self.pool_size or traits.seed_tracks or traits.genres:
+            return None
+        if not np.isnan(traits_vectors(traits)[0]).all():
+            limit = requested_limit(traits)
+            scores = score_songs(self.pool, traits, self.weights)
+            order = np.argsort(scores, kind="stable")[:limit]
+            if len(order) == limit and (scores[order] <= self.pool_max_distance).all():
+                self.pool_hits += 1
+                return self.pool.take(order.tolist())
+        self.pool_misses += 1
+        return None
+
+    def remember(self, songs: SongBatch):
+        """Add unseen songs to the pool, dropping the oldest past `pool_size`."""
+        if not self.pool_size:
+            return
+        fresh = []
+        for i, track_id in enumerate(songs.track_ids):
+            if track_id is not None and track_id not in self._pool_ids:
+                self._pool_ids.add(track_id)
+                fresh.append(i)
+        if not fresh:
+            return
+        pool = SongBatch.concat([self.pool, songs.take(fresh)])
+        overflow = len(pool) - self.pool_size
+        if overflow > 0:
+            self._pool_ids.difference_update(pool.track_ids[:overflow])
+            pool = pool.take(range(overflow, len(pool)))
+        self.pool = pool
+
+    def stats(self) -> dict:
+        return {
+            "pool_size": len(self.pool),
+            "pool_hits": self.pool_hits,
+            "pool_misses": self.pool_misses,
+        }
@@ -0,0 +1,88 @@
+import asyncio
+import contextvars
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.models.spotify_token import SpotifyToken
+from framework.middleware import deadline, tracing
+from framework.services.http_client import DeadlineExceeded
+
+
+class SpotifyTokenCache:
+    """In-process cache of Spotify tokens keyed by user id.
+
+    Tokens are considered fresh until `refresh_margin` seconds before they
+    expire. Concurrent misses for the same user share a single refresh. The
+    shared refresh runs without any one caller's deadline or trace; each
+    caller waits for it only as long as its own deadline allows.
+    """
+
+    def __init__(self, refresh_margin: float = 60):
+        self.refresh_margin = refresh_margin
+        self._entries: Dict[str, Tuple[SpotifyToken, float]] = {}  # user_id -> (token, expires_at)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[SpotifyToken]:
+        """Return the cached token if it is not close to expiring."""
+        entry = self._entries.get(user_id)
+        if entry and time.monotonic() < entry[1] - self.refresh_margin:
+            return entry[0]
+        return None
+
+    def peek(self, user_id: str) -> Optional[SpotifyToken]:
+        """Return the cached token even if it is stale (its refresh_token is still usable)."""
+        entry = self._entries.get(user_id)
+        return entry[0] if entry else None
+
+    def set(self, user_id: str, token: SpotifyToken):
+        self._entries[user_id] = (token, time.monotonic() + token.expires_in)
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+
+    async def get_or_refresh(self,
+                             user_id: str,
+                             refresh: Callable[[], Awaitable[Optional[SpotifyToken]]]) -> Optional[SpotifyToken]:
+        """Return a fresh token, running `refresh` at most once per user at a time."""
+        token = self.get(user_id)
+        if token:
+            self.hits += 1
+            return token
+        self.misses += 1
+
+        future = self._inflight.get(user_id)
+        if future is None:
+            context = contextvars.copy_context()
+            context.run(deadline.clear)
+            context.run(tracing.detach)
+            future = asyncio.get_running_loop().create_task(self._refresh(user_id, refresh), context=context)
+            self._inflight[user_id] = future
+            future.add_done_callback(lambda f: self._refresh_done(user_id, f))
+
+        # Shield so one caller giving up does not cancel the refresh for the others
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), deadline.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("Deadline exceeded waiting for a Spotify token refresh") from None
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "inflight": len(self._inflight),
+        }
+
+    def _refresh_done(self, user_id: str, future: asyncio.Future):
+        if self._inflight.get(user_id) is future:
+            del self._inflight[user_id]
+        if not future.cancelled():
+            future.exception()  # mark as retrieved even if every waiter went away
+
+    async def _refresh(self, user_id: str, refresh: Callable[[], Awaitable[Optional[SpotifyToken]]]):
+        token = await refresh()
+        if token:
+            self.set(user_id, token)
+        return token
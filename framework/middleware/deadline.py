@@ -0,0 +1,97 @@
+#
+# Per-request deadlines.
+#
+# DeadlineMiddleware gives every HTTP request a time budget, taken from the
+# X-Deadline-Ms header a caller sends (remaining milliseconds) or from the
+# route's default, whichever is shorter. The absolute deadline is kept in a
+# context variable so any code running for the request can ask how much time
+# is left; HttpClient uses it to size downstream timeouts and forwards the
+# remainder in the same header.
+#
+# The deadline is dropped once the response body has been sent, so
+# BackgroundTasks that run after the response are not cut short by it.
+#
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)  # time.monotonic() value
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request, or None when it has no deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired(margin: float = 0.0) -> bool:
+    """Whether less than `margin` seconds are left. Always False without a deadline."""
+    left = remaining()
+    return left is not None and left <= margin
+
+
+def set_deadline(seconds: float):
+    """Start a budget of `seconds` from now, never extending one that is already set."""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    return _deadline.set(deadline)
+
+
+def clear():
+    """Drop the deadline for the rest of the current task (e.g. in detached background work)."""
+    _deadline.set(None)
+
+
+class DeadlineMiddleware:
+
+    def __init__(self, app, default: Optional[float] = 30.0, routes: Optional[Dict[str, float]] = None):
+        self.app = app
+        self.default = default
+        # Longest matching path prefix wins
+        self.routes = sorted((routes or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        budget = self.route_budget(scope["path"])
+        header = self._header(scope)
+        if header is not None:
+            budget = min(budget, header) if budget is not None else header
+        if budget is None:
+            return await self.app(scope, receive, send)
+
+        token = set_deadline(budget)
+
+        async def send_wrapper(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                clear()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _deadline.reset(token)
+
+    def route_budget(self, path: str) -> Optional[float]:
+        for prefix, seconds in self.routes:
+            if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+                return seconds
+        return self.default
+
+    @staticmethod
+    def _header(scope) -> Optional[float]:
+        name = DEADLINE_HEADER.lower().encode()
+        for key, value in scope.get("headers", ()):
+            if key == name:
+                try:
+                    return max(0.0, int(value) / 1000)
+                except ValueError:
+                    return None
+        return None
@@ -0,0 +1,64 @@
+#
+# Per-route request metrics.
+#
+# Routes are labelled by their path template ("/playlists/{playlist_id}"),
+# never the raw path, so ids do not blow up the number of series. Requests
+# that match no route are counted under "unmatched".
+#
+import time
+from typing import Dict
+
+from framework.utils.metrics import Counter, Gauge, Histogram
+
+REQUESTS = Counter("http_requests_total", "HTTP requests handled, by route and status.",
+                   ["method", "route", "status"])
+IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests currently being handled.", ["method"])
+LATENCY = Histogram("http_request_duration_seconds", "Time to handle an HTTP request, until the response is complete.",
+                    ["method", "route", "status"])
+
+
+class MetricsMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[object, str] = {}  # endpoint -> path template
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        in_progress = IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            route = self._route(scope)
+            REQUESTS.labels(method, route, status).inc()
+            LATENCY.labels(method, route, status).observe(time.perf_counter() - started)
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            # Routing stored the matched endpoint in the scope; find its template once
+            for route in getattr(scope.get("app"), "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            else:
+                path = "unmatched"
+            self._route_paths[endpoint] = path
+        return path
@@ -0,0 +1,120 @@
+#
+# Opt-in per-request CPU profiling.
+#
+# A request is run under cProfile when it carries the configured key in the
+# X-Profile-Key header, or when it is picked by the sampling ratio (optionally
+# limited to one path prefix) that an admin can change at runtime. Profiles
+# go to a ProfileStore, a bounded ring of pstats files on disk.
+#
+# Only one request is profiled at a time: cProfile hooks the whole thread, so
+# a profile also contains whatever else the event loop ran while the request
+# was awaiting. Compare the request's own frames against the total, and
+# profile on a quiet instance when the numbers need to be clean.
+#
+# Requests pay nothing when profiling is off: the application only installs
+# ProfilingMiddleware when a profiling key is configured.
+#
+import cProfile
+import logging
+import random
+import secrets
+import time
+from typing import Callable, Optional
+
+from framework.middleware import tracing
+from framework.utils.profile_store import ProfileStore
+
+PROFILE_HEADER = "X-Profile-Key"
+ADMIN_PREFIX = "/admin/"  # the endpoints that manage profiles are never profiled themselves
+
+
+class RequestProfiler:
+
+    def __init__(self, store: ProfileStore, key: Optional[str] = None,
+                 sample_rate: float = 0.0, route_prefix: str = "/"):
+        self.store = store
+        self.key = key
+        self.sample_rate = sample_rate
+        self.route_prefix = route_prefix
+        self.busy = False
+        self.profiled = 0
+        self.skipped_busy = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.key)
+
+    def authorized(self, key: Optional[str]) -> bool:
+        return self.enabled and key is not None and secrets.compare_digest(key.encode(), self.key.encode())
+
+    def wanted(self, scope) -> bool:
+        """Whether this request asked to be profiled or was sampled."""
+        if scope["path"].startswith(ADMIN_PREFIX):
+            return False
+        name = PROFILE_HEADER.lower().encode()
+        for key, value in scope.get("headers", ()):
+            if key == name:
+                return self.authorized(value.decode("latin-1"))
+        return (self.sample_rate > 0 and scope["path"].startswith(self.route_prefix)
+                and random.random() < self.sample_rate)
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "route_prefix": self.route_prefix,
+            "busy": self.busy,
+            "profiled": self.profiled,
+            "skipped_busy": self.skipped_busy,
+        }
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, app, profiler: Callable[[], RequestProfiler]):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        profiler = self.profiler()
+        if not profiler.wanted(scope):
+            return await self.app(scope, receive, send)
+        if profiler.busy:
+            profiler.skipped_busy += 1
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiler.busy = True
+        profile = cProfile.Profile()
+        created = time.time()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - started
+            profiler.busy = False
+            profiler.profiled += 1
+            info = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 1),
+                "created": created,
+                "correlation_id": tracing.correlation_id() if tracing.current_trace() is not None else None,
+            }
+            try:
+                profile_id = await profiler.store.save(profile, info)
+                logging.info(f"Profiled {scope['method']} {scope['path']} as {profile_id}")
+            except OSError as e:
+                logging.error(f"Could not store profile for {scope['method']} {scope['path']}: {e}")
@@ -0,0 +1,199 @@
+#
+# Request tracing: correlation ids, spans and Server-Timing.
+#
+# TracingMiddleware takes the caller's X-Correlation-ID (or makes one up) and
+# opens a trace for the request in a context variable. Code running for the
+# request reads the id with `correlation_id()` and times its steps with
+# `span(...)`; HttpClient records one client span per downstream attempt and
+# forwards the ids as X-Correlation-ID and a W3C `traceparent`.
+#
+# The response carries the correlation id and a Server-Timing header with
+# every span finished before the headers went out, so the browser's network
+# panel shows which hop used up the time. Finished traces are handed to an
+# optional exporter (see framework.utils.span_exporter) once the request,
+# including its BackgroundTasks, is complete.
+#
+import re
+import secrets
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+CORRELATION_HEADER = "X-Correlation-ID"
+
+SERVER = "server"
+CLIENT = "client"
+INTERNAL = "internal"
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+_TIMING_NAME = re.compile(r"[^A-Za-z0-9_.-]+")
+_CORRELATION_ID = re.compile(r"^[A-Za-z0-9_.:-]{1,128}$")
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    kind: str = INTERNAL
+    start_ns: int = 0
+    end_ns: Optional[int] = None
+    attributes: Dict[str, object] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def end(self, error: Optional[str] = None):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = error
+
+
+@dataclass
+class Trace:
+    correlation_id: str
+    trace_id: str
+    spans: List[Span] = field(default_factory=list)
+
+    def start_span(self, name: str, parent: Optional[Span] = None, kind: str = INTERNAL, **attributes) -> Span:
+        span = Span(name, secrets.token_hex(8), parent.span_id if parent is not None else None, kind,
+                    time.time_ns(), attributes=attributes)
+        self.spans.append(span)
+        return span
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def correlation_id() -> str:
+    """The current request's correlation id, or a fresh one outside a request."""
+    trace = _trace.get()
+    return trace.correlation_id if trace is not None else str(uuid.uuid4())
+
+
+def start_span(name: str, kind: str = INTERNAL, **attributes) -> Optional[Span]:
+    """Start a child of the current span; the caller must `end()` it. None outside a trace."""
+    trace = _trace.get()
+    if trace is None:
+        return None
+    return trace.start_span(name, _span.get(), kind, **attributes)
+
+
+@contextmanager
+def span(name: str, kind: str = INTERNAL, **attributes) -> Iterator[Optional[Span]]:
+    """Time a block as a span nested under the current one."""
+    current = start_span(name, kind, **attributes)
+    if current is None:
+        yield None
+        return
+    token = _span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=repr(e))
+        raise
+    finally:
+        current.end()
+        _span.reset(token)
+
+
+def detach():
+    """Leave the current trace for the rest of the current task (e.g. in work shared by several requests)."""
+    _trace.set(None)
+    _span.set(None)
+
+
+def traceparent(span_id: Optional[str] = None) -> Optional[str]:
+    """W3C traceparent header value for a call made from the current span."""
+    trace = _trace.get()
+    if trace is None:
+        return None
+    if span_id is None:
+        current = _span.get()
+        span_id = current.span_id if current is not None else secrets.token_hex(8)
+    return f"00-{trace.trace_id}-{span_id}-01"
+
+
+def server_timing(trace: Trace, root: Span) -> str:
+    """Server-Timing value: one entry per finished span, then the total so far."""
+    entries = []
+    for s in trace.spans:
+        if s is root or s.end_ns is None:
+            continue
+        name = _TIMING_NAME.sub("_", s.name)
+        desc = s.attributes.get("http.route") or s.name
+        entries.append(f'{name};desc="{desc}";dur={s.duration_ms:.1f}')
+    entries.append(f"total;dur={root.duration_ms:.1f}")
+    return ", ".join(entries)
+
+
+class TracingMiddleware:
+
+    def __init__(self, app, export: Optional[Callable[[Trace], Awaitable]] = None):
+        self.app = app
+        self.export = export
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope.get("headers", ())}
+        outer = _trace.get()
+        if outer is not None:
+            # Dispatched in-process from another request (e.g. /batch): a child span of that trace
+            with span(f"{scope['method']} {scope['path']}", kind=SERVER):
+                return await self.app(scope, receive, send)
+
+        cid = headers.get(CORRELATION_HEADER.lower(), "")
+        if not _CORRELATION_ID.match(cid):
+            cid = str(uuid.uuid4())
+        parent = _TRACEPARENT.match(headers.get("traceparent", ""))
+        trace = Trace(cid, parent.group(1) if parent else _trace_id(cid))
+        root = trace.start_span(f"{scope['method']} {scope['path']}", kind=SERVER,
+                                **{"http.method": scope["method"], "http.target": scope["path"]})
+        if parent:
+            root.parent_id = parent.group(2)
+        trace_token = _trace.set(trace)
+        span_token = _span.set(root)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (CORRELATION_HEADER.lower().encode(), cid.encode("latin-1")),
+                    (b"server-timing", server_timing(trace, root).encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            root.end(error=repr(e))
+            raise
+        finally:
+            root.end()
+            _span.reset(span_token)
+            _trace.reset(trace_token)
+            if self.export is not None:
+                await self.export(trace)
+
+
+def _trace_id(cid: str) -> str:
+    """Reuse a UUID correlation id as the trace id so logs and traces line up."""
+    try:
+        return uuid.UUID(cid).hex
+    except ValueError:
+        return secrets.token_hex(16)
@@ -0,0 +1,434 @@
+#
+# Shared async HTTP client for talking to downstream services.
+#
+# One instance is meant to live for the whole process so that every service
+# reuses the same connection pools (httpx keeps one pool per origin) and
+# keep-alive connections instead of opening a new TCP connection per call.
+#
+# Identical idempotent requests that are in flight at the same time are
+# coalesced: the first caller starts the upstream call and every other caller
+# waits for, and shares, its response. The shared call belongs to no single
+# request, so it runs without the first caller's deadline and trace; each
+# caller instead waits for at most its own remaining deadline and records its
+# own client span for the call.
+#
+# Each registered downstream gets its own timeouts and circuit breaker, so a
+# hung or failing dependency is cut off quickly instead of tying up every
+# request that touches it.
+#
+# Idempotent GETs can also be retried with jittered backoff and hedged: when
+# the first attempt is slower than the endpoint's recent p95, a second one is
+# sent and whichever answers first wins. Retries and hedges both draw on one
+# RetryBudget so they cannot multiply the load on a struggling service.
+#
+# When the current request has a deadline (framework.middleware.deadline),
+# every attempt is capped to the time left and the remainder is forwarded to
+# the downstream in the X-Deadline-Ms header.
+#
+# Every attempt is recorded as a client span of the current trace
+# (framework.middleware.tracing) and carries its W3C traceparent, so each hop
+# shows up in the caller's Server-Timing header and in exported traces.
+#
+import asyncio
+import contextvars
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from framework.middleware import deadline, tracing
+from framework.utils.circuit_breaker import CircuitBreaker
+from framework.utils.latency_tracker import LatencyTracker
+from framework.utils.metrics import Counter, Histogram
+from framework.utils.retry_budget import RetryBudget
+
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+BODY_ARGUMENTS = ("json", "content", "data", "files")
+RETRY_STATUSES = (502, 503, 504)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of calling a downstream whose circuit is open."""
+
+    def __init__(self, downstream: str, retry_after: float, request: httpx.Request):
+        super().__init__(f"Circuit for {downstream} is open", request=request)
+        self.downstream = downstream
+        self.retry_after = retry_after
+
+
+def unavailable_exception(e: httpx.TransportError) -> HTTPException:
+    """HTTPException for a downstream that could not be reached: 503 (or 504 on timeout)."""
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(e),
+                             headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    if isinstance(e, DeadlineExceeded):
+        return HTTPException(status_code=504, detail="Request deadline exceeded")
+    if isinstance(e, httpx.TimeoutException):
+        return HTTPException(status_code=504, detail=f"Timed out calling {e.request.url.host}")
+    return HTTPException(status_code=503, detail=f"Could not reach {e.request.url.host}: {e!r}")
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """Raised instead of calling a downstream once the request's deadline has passed."""
+
+
+DOWNSTREAM_LATENCY = Histogram("downstream_request_duration_seconds",
+                               "Duration of calls to downstream services, per attempt.", ["downstream", "method"])
+DOWNSTREAM_ERRORS = Counter("downstream_errors_total",
+                            "Failed downstream calls by class: timeout, connection, transport, 4xx, 5xx, "
+                            "circuit_open or deadline.", ["downstream", "error"])
+DOWNSTREAM_REQUEST_BYTES = Counter("downstream_request_bytes_total", "Request body bytes sent downstream.",
+                                   ["downstream"])
+DOWNSTREAM_RESPONSE_BYTES = Counter("downstream_response_bytes_total", "Response body bytes received from downstream.",
+                                    ["downstream"])
+
+
+def _error_class(e: httpx.TransportError) -> str:
+    if isinstance(e, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(e, httpx.NetworkError):
+        return "connection"
+    return "transport"
+
+
+@dataclass
+class Downstream:
+    name: str
+    base_url: str
+    timeout: httpx.Timeout
+    breaker: Optional[CircuitBreaker] = None
+    hedge: bool = False     # hedge idempotent GETs slower than the endpoint's p95
+    max_retries: int = 0    # retries for idempotent GETs that fail or return 502/503/504
+
+
+class HttpClient:
+    """Process-wide async HTTP client with pooled, keep-alive connections."""
+
+    def __init__(self,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.0,
+                 coalesce: bool = True,
+                 timeout: Optional[httpx.Timeout] = None,
+                 retry_budget: Optional[RetryBudget] = None,
+                 retry_backoff: float = 0.05,
+                 min_hedge_delay: float = 0.01):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.coalesce = coalesce
+        # Used for URLs that do not belong to a registered downstream
+        self.timeout = timeout if timeout is not None else httpx.Timeout(30.0, connect=5.0)
+        self.downstreams: List[Downstream] = []
+        self.retry_budget = retry_budget if retry_budget is not None else RetryBudget()
+        self.retry_backoff = retry_backoff
+        self.min_hedge_delay = min_hedge_delay
+        self.latency = LatencyTracker()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.upstream_requests = 0
+        self.coalesced_requests = 0
+        self.idempotent_requests = 0
+        self.retries = 0
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The underlying httpx client, created lazily on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(limits=self.limits, follow_redirects=True, timeout=None)
+        return self._client
+
+    def add_downstream(self, name: str, base_url: str, timeout: Optional[httpx.Timeout] = None,
+                       breaker: Optional[CircuitBreaker] = None, hedge: bool = False, max_retries: int = 0):
+        """Give requests under `base_url` their own timeouts, circuit breaker and retry policy."""
+        self.downstreams.append(Downstream(
+            name, base_url.rstrip("/"), timeout if timeout is not None else self.timeout, breaker, hedge, max_retries
+        ))
+        # Longest prefix wins when base URLs nest
+        self.downstreams.sort(key=lambda d: len(d.base_url), reverse=True)
+
+    def downstream_for(self, url: str) -> Optional[Downstream]:
+        url = str(url)
+        for downstream in self.downstreams:
+            if url == downstream.base_url or url.startswith(downstream.base_url + "/"):
+                return downstream
+        return None
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        # requests silently dropped None query params; keep that behaviour so
+        # optional Traits fields are not sent as empty strings.
+        params = kwargs.get("params")
+        if isinstance(params, dict):
+            kwargs["params"] = {k: v for k, v in params.items() if v is not None}
+
+        key = self._coalesce_key(method, url, kwargs) if self.coalesce else None
+        if key is None:
+            return await self._send(method, url, **kwargs)
+
+        downstream = self.downstream_for(url)
+        future = self._inflight.get(key)
+        budget = deadline.remaining()
+        if budget is not None and budget <= 0:
+            DOWNSTREAM_ERRORS.labels(downstream.name if downstream is not None else "other", "deadline").inc()
+            raise DeadlineExceeded("Deadline exceeded", request=httpx.Request(method, url))
+        hop = self._client_span(downstream, method, url, None, **{"http.coalesced": future is not None})
+        if future is not None:
+            self.coalesced_requests += 1
+        else:
+            if hop is not None:
+                headers = httpx.Headers(kwargs.get("headers"))
+                headers["traceparent"] = tracing.traceparent(hop.span_id)
+                kwargs["headers"] = headers
+            context = contextvars.copy_context()
+            context.run(self._detach)
+            future = asyncio.get_running_loop().create_task(self._send(method, url, **kwargs), context=context)
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._request_done(key, f))
+        try:
+            # Shield so a waiter giving up does not cancel the call for the others
+            if budget is None:
+                response = await asyncio.shield(future)
+            else:
+                try:
+                    response = await asyncio.wait_for(asyncio.shield(future), budget)
+                except asyncio.TimeoutError:
+                    DOWNSTREAM_ERRORS.labels(downstream.name if downstream is not None else "other", "deadline").inc()
+                    raise DeadlineExceeded("Deadline exceeded", request=httpx.Request(method, url)) from None
+        except BaseException as e:
+            if hop is not None:
+                hop.end(error=repr(e))
+            raise
+        if hop is not None:
+            hop.attributes["http.status_code"] = response.status_code
+            hop.end(error=f"HTTP {response.status_code}" if response.status_code >= 500 else None)
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "upstream_requests": self.upstream_requests,
+            "coalesced_requests": self.coalesced_requests,
+            "inflight": len(self._inflight),
+            "circuits": {d.name: d.breaker.stats() for d in self.downstreams if d.breaker is not None},
+            "idempotent_requests": self.idempotent_requests,
+            "retries": self.retries,
+            "retry_rate": self.retries / self.idempotent_requests if self.idempotent_requests else 0.0,
+            "hedged_requests": self.hedged_requests,
+            "hedge_rate": self.hedged_requests / self.idempotent_requests if self.idempotent_requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "retry_budget": self.retry_budget.stats(),
+            "hedge_thresholds": self.latency.stats(),
+        }
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Upstream call with the downstream's timeout, retry and hedging policy applied."""
+        downstream = self.downstream_for(url)
+        kwargs.setdefault("timeout", downstream.timeout if downstream is not None else self.timeout)
+        if downstream is None or not self._idempotent(method, kwargs):
+            return await self._attempt(downstream, method, url, None, **kwargs)
+
+        self.idempotent_requests += 1
+        self.retry_budget.record_request()
+        endpoint = self._endpoint(downstream, method, url)
+        attempt = 0
+        while True:
+            try:
+                response = await self._hedged(downstream, method, url, endpoint, **kwargs)
+                if response.status_code not in RETRY_STATUSES or not self._may_retry(downstream, attempt):
+                    return response
+            except httpx.TransportError as e:
+                if isinstance(e, (CircuitOpenError, DeadlineExceeded)) or not self._may_retry(downstream, attempt):
+                    raise
+            attempt += 1
+            self.retries += 1
+            # Full jitter so retries from concurrent callers do not line up
+            backoff = random.uniform(0, self.retry_backoff * 2 ** attempt)
+            if deadline.expired(backoff):
+                raise DeadlineExceeded("Deadline exceeded before retry", request=httpx.Request(method, url))
+            await asyncio.sleep(backoff)
+
+    async def _hedged(self, downstream: Downstream, method: str, url: str, endpoint: Hashable,
+                      **kwargs) -> httpx.Response:
+        """Send one attempt; if it outlasts the endpoint's p95, race a second one against it."""
+        delay = self.latency.value(endpoint) if downstream.hedge else None
+        if delay is None:
+            return await self._attempt(downstream, method, url, endpoint, **kwargs)
+
+        pending = {asyncio.ensure_future(self._attempt(downstream, method, url, endpoint, **kwargs))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=max(delay, self.min_hedge_delay))
+            if not done:
+                if not self.retry_budget.try_acquire():
+                    return await next(iter(pending))
+                self.hedged_requests += 1
+                hedge = asyncio.ensure_future(self._attempt(downstream, method, url, endpoint, **kwargs))
+                pending.add(hedge)
+                while not done or (all(task.exception() is not None for task in done) and pending):
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer an attempt that produced a response over one that failed
+                winner = next((task for task in done if task.exception() is None), next(iter(done)))
+                if winner is hedge:
+                    self.hedge_wins += 1
+                return winner.result()
+            return next(iter(done)).result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _attempt(self, downstream: Optional[Downstream], method: str, url: str,
+                       endpoint: Optional[Hashable], **kwargs) -> httpx.Response:
+        """One upstream call, timed as a client span of the current trace."""
+        hop = self._client_span(downstream, method, url, endpoint)
+        if hop is None:
+            return await self._call(downstream, method, url, endpoint, **kwargs)
+        headers = httpx.Headers(kwargs.get("headers"))
+        headers["traceparent"] = tracing.traceparent(hop.span_id)
+        kwargs["headers"] = headers
+        try:
+            response = await self._call(downstream, method, url, endpoint, **kwargs)
+        except BaseException as e:
+            hop.end(error=repr(e))
+            raise
+        hop.attributes["http.status_code"] = response.status_code
+        hop.end(error=f"HTTP {response.status_code}" if response.status_code >= 500 else None)
+        return response
+
+    async def _call(self, downstream: Optional[Downstream], method: str, url: str,
+                    endpoint: Optional[Hashable], **kwargs) -> httpx.Response:
+        """One upstream call through the downstream's circuit breaker."""
+        name = downstream.name if downstream is not None else "other"
+        budget = deadline.remaining()
+        if budget is not None:
+            if budget <= 0:
+                DOWNSTREAM_ERRORS.labels(name, "deadline").inc()
+                raise DeadlineExceeded("Deadline exceeded", request=httpx.Request(method, url))
+            kwargs = self._with_deadline(budget, kwargs)
+        breaker = downstream.breaker if downstream is not None else None
+        permit = breaker.acquire() if breaker is not None else None
+        if breaker is not None and permit is None:
+            DOWNSTREAM_ERRORS.labels(name, "circuit_open").inc()
+            raise CircuitOpenError(downstream.name, breaker.retry_after(), request=httpx.Request(method, url))
+        self.upstream_requests += 1
+        started = time.monotonic()
+        try:
+            if budget is None:
+                response = await self.client.request(method, url, **kwargs)
+            else:
+                # httpx timeouts are per network operation; this bounds the whole call
+                response = await asyncio.wait_for(self.client.request(method, url, **kwargs), budget)
+        except httpx.TransportError as e:
+            DOWNSTREAM_LATENCY.labels(name, method).observe(time.monotonic() - started)
+            DOWNSTREAM_ERRORS.labels(name, _error_class(e)).inc()
+            if breaker is not None:
+                breaker.record_failure(permit)
+            raise
+        except asyncio.TimeoutError:
+            DOWNSTREAM_LATENCY.labels(name, method).observe(time.monotonic() - started)
+            DOWNSTREAM_ERRORS.labels(name, "deadline").inc()
+            # Our budget ran out; that says nothing about the downstream's health
+            if breaker is not None:
+                breaker.release(permit)
+            raise DeadlineExceeded("Deadline exceeded", request=httpx.Request(method, url)) from None
+        except BaseException:
+            if breaker is not None:
+                breaker.release(permit)
+            if endpoint is not None:
+                # A cancelled (losing) attempt was at least this slow; keep the tail visible
+                self.latency.record(endpoint, time.monotonic() - started)
+            raise
+        elapsed = time.monotonic() - started
+        if endpoint is not None:
+            self.latency.record(endpoint, elapsed)
+        DOWNSTREAM_LATENCY.labels(name, method).observe(elapsed)
+        DOWNSTREAM_REQUEST_BYTES.labels(name).inc(len(response.request.content))
+        DOWNSTREAM_RESPONSE_BYTES.labels(name).inc(len(response.content))
+        if response.status_code >= 400:
+            DOWNSTREAM_ERRORS.labels(name, "5xx" if response.status_code >= 500 else "4xx").inc()
+        # 4xx means the dependency is up and answering; only 5xx counts against it
+        if breaker is not None:
+            if response.status_code >= 500:
+                breaker.record_failure(permit)
+            else:
+                breaker.record_success(permit)
+        return response
+
+    def _client_span(self, downstream: Optional[Downstream], method: str, url: str,
+                     endpoint: Optional[Hashable], **attributes) -> Optional[tracing.Span]:
+        if downstream is None:
+            return tracing.start_span("other", tracing.CLIENT, **{"http.method": method.upper()}, **attributes)
+        return tracing.start_span(downstream.name, tracing.CLIENT, **{
+            "http.method": method.upper(),
+            "http.url": str(url).split("?", 1)[0],
+            "http.route": endpoint or self._endpoint(downstream, method, url),
+        }, **attributes)
+
+    @staticmethod
+    def _detach():
+        """Run the rest of the current context free of any one request's deadline and trace."""
+        deadline.clear()
+        tracing.detach()
+
+    @staticmethod
+    def _with_deadline(budget: float, kwargs: dict) -> dict:
+        """Copy of the request kwargs with timeouts capped to `budget` and the deadline header set."""
+        timeout = httpx.Timeout(kwargs["timeout"])
+        kwargs = dict(kwargs)
+        kwargs["timeout"] = httpx.Timeout(
+            connect=min(timeout.connect, budget) if timeout.connect is not None else budget,
+            read=min(timeout.read, budget) if timeout.read is not None else budget,
+            write=min(timeout.write, budget) if timeout.write is not None else budget,
+            pool=min(timeout.pool, budget) if timeout.pool is not None else budget,
+        )
+        headers = httpx.Headers(kwargs.get("headers"))
+        headers[deadline.DEADLINE_HEADER] = str(int(budget * 1000))
+        kwargs["headers"] = headers
+        return kwargs
+
+    def _may_retry(self, downstream: Downstream, attempt: int) -> bool:
+        return attempt < downstream.max_retries and self.retry_budget.try_acquire()
+
+    @staticmethod
+    def _idempotent(method: str, kwargs: dict) -> bool:
+        return method.upper() in IDEMPOTENT_METHODS and all(kwargs.get(k) is None for k in BODY_ARGUMENTS)
+
+    @staticmethod
+    def _endpoint(downstream: Downstream, method: str, url: str) -> Hashable:
+        """Latency key for a URL with its ids blanked out, e.g. GET user /users/{}/playlists."""
+        path = str(url)[len(downstream.base_url):].split("?", 1)[0]
+        segments = [s if i % 2 == 0 else "{}" for i, s in enumerate(path.strip("/").split("/"))]
+        return f"{method.upper()} {downstream.name} /{'/'.join(segments)}"
+
+    def _request_done(self, key: Hashable, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            future.exception()  # mark as retrieved even if every waiter went away
+
+    @staticmethod
+    def _coalesce_key(method: str, url: str, kwargs: dict) -> Optional[Hashable]:
+        """Key identifying requests that can share one response, or None if this one cannot.
+
+        Only idempotent methods without a body are coalesced. The key is the
+        method, URL, query params and credentials; per-call headers such as
+        the correlation id are ignored.
+        """
+        if not HttpClient._idempotent(method, kwargs):
+            return None
+        method = method.upper()
+        params = tuple(sorted(httpx.QueryParams(kwargs.get("params")).multi_items()))
+        headers = httpx.Headers(kwargs.get("headers"))
+        return method, str(url), params, headers.get("authorization")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def shutdown(self):
+        await self.aclose()
@@ -1,22 +1,79 @@
 #
-# Placeholder for implementing the service factory and service locator patterns.
+# Service factory and service locator.
 #
 # https://medium.com/javarevisited/service-locator-factory-pattern-7bb9e835b709
 #
-from abc import ABC, abstractmethod
-
-# TODO -- Implement the framework.
+# Subclasses register a provider per service name. Each service is built once,
+# on first use, and then shared for the lifetime of the process, so services
+# can own long-lived state (connection pools, caches, throttles). Services may
+# define optional `async def startup(self)` / `async def shutdown(self)` hooks,
+# which are called from the application's lifespan.
 #
+import inspect
+import logging
+from abc import ABC
+from typing import Any, Callable, Dict, Optional
 
 
 class BaseServiceFactory(ABC):
 
+    _providers: Dict[str, Callable[[], Any]] = {}
+    _instances: Dict[str, Any] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Every concrete factory keeps its own registry
+        cls._providers = {}
+        cls._instances = {}
+
     def __init__(self):
         pass
 
     @classmethod
-    @abstractmethod
-    def get_service(cls, service_name):
-        raise NotImplementedError()
+    def register(cls, service_name: str, provider: Callable[[], Any]):
+        """Register how to build a service. Replaces any existing instance."""
+        cls._providers[service_name] = provider
+        cls._instances.pop(service_name, None)
+
+    @classmethod
+    def get_service(cls, service_name: str) -> Optional[Any]:
+        instance = cls._instances.get(service_name)
+        if instance is None:
+            provider = cls._providers.get(service_name)
+            if provider is None:
+                return None
+            instance = provider()
+            cls._instances[service_name] = instance
+        return instance
 
+    @classmethod
+    def instances(cls) -> Dict[str, Any]:
+        """Services built so far, by name (does not build any)."""
+        return dict(cls._instances)
+
+    @classmethod
+    async def startup(cls):
+        """Build every registered service and run its startup hook."""
+        for service_name in list(cls._providers):
+            cls.get_service(service_name)
+        for service_name, instance in list(cls._instances.items()):
+            await cls._run_hook(service_name, instance, "startup")
+
+    @classmethod
+    async def shutdown(cls):
+        """Run shutdown hooks in reverse creation order and drop the instances."""
+        for service_name, instance in reversed(list(cls._instances.items())):
+            await cls._run_hook(service_name, instance, "shutdown")
+        cls._instances.clear()
 
+    @staticmethod
+    async def _run_hook(service_name: str, instance: Any, hook: str):
+        method = getattr(instance, hook, None)
+        if method is None:
+            return
+        try:
+            result = method()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logging.error(f"{service_name} {hook} failed: {e}")
@@ -0,0 +1,77 @@
+#
+# Fixed-size Bloom filter for cheap "have we seen this key before?" checks.
+#
+# False positives are possible (at roughly `error_rate` while fewer than
+# `capacity` keys have been added), false negatives are not. Once capacity is
+# reached the filter starts over so the false-positive rate stays bounded.
+#
+import hashlib
+import json
+import math
+import os
+from typing import Optional
+
+
+class BloomFilter:
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[i >> 3] & (1 << (i & 7)) for i in self._positions(key))
+
+    def __len__(self):
+        return self.count
+
+    def add(self, key: str):
+        if self.count >= self.capacity:
+            self.clear()
+        for i in self._positions(key):
+            self._bits[i >> 3] |= 1 << (i & 7)
+        self.count += 1
+
+    def clear(self):
+        self._bits = bytearray(len(self._bits))
+        self.count = 0
+
+    def estimated_false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def save(self, path: str):
+        """Write the filter to `path` (atomically) so it can be reloaded after a restart."""
+        header = json.dumps({"capacity": self.capacity, "error_rate": self.error_rate, "count": self.count})
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header.encode() + b"\n")
+            f.write(self._bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BloomFilter"]:
+        """Read a filter written by `save`, or None if the file is missing or unreadable."""
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                bits = f.read()
+            bloom = cls(capacity=int(header["capacity"]), error_rate=float(header["error_rate"]))
+            count = int(header["count"])
+        except (OSError, ValueError, KeyError, TypeError, ArithmeticError):
+            # Missing, truncated or foreign file: bad JSON, missing keys, a non-object header or impossible sizes
+            return None
+        if len(bits) != len(bloom._bits):
+            return None
+        bloom._bits = bytearray(bits)
+        bloom.count = count
+        return bloom
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
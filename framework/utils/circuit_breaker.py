@@ -0,0 +1,113 @@
+#
+# Circuit breaker for calls to one downstream dependency.
+#
+# After `failure_threshold` consecutive failures the circuit opens and calls
+# fail fast without touching the dependency. Once `reset_timeout` seconds have
+# passed a single probe call is let through (half-open): if it succeeds the
+# circuit closes again, otherwise it reopens for another `reset_timeout`.
+#
+# Every call holds a Permit stamped with the breaker's state generation when
+# it started. Outcomes of calls that started before the last state change are
+# ignored, so a slow success from before the circuit opened cannot close it,
+# and only the probe itself can give back the half-open probe slot.
+#
+# Not thread-safe; meant to be used from the event loop only.
+#
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+@dataclass(frozen=True)
+class Permit:
+    generation: int  # breaker state generation the call started in
+    probe: bool      # whether the call holds the half-open probe slot
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, name: str = "downstream"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0          # consecutive failures while closed
+        self.opened_at = 0.0
+        self._probing = False
+        self.generation = 0        # bumped on every state change
+        self.rejected = 0
+        self.trips = 0
+        self.stale_outcomes = 0    # results ignored because the state changed since the call started
+
+    def acquire(self) -> Optional[Permit]:
+        """A permit for a call that may go out now, or None. In half-open state only one probe is allowed."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+        if self.state == CLOSED:
+            return Permit(self.generation, probe=False)
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return Permit(self.generation, probe=True)
+        self.rejected += 1
+        return None
+
+    def record_success(self, permit: Permit):
+        if not self._current(permit):
+            return
+        if self.state != CLOSED:
+            logging.info(f"Circuit {self.name} closed")
+            self._set_state(CLOSED)
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self, permit: Permit):
+        if not self._current(permit):
+            return
+        if self.state == HALF_OPEN:
+            self._probing = False
+            self._open()
+            return
+        self.failures += 1
+        if self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def release(self, permit: Permit):
+        """Give back the probe slot of a call that ended without an outcome (e.g. cancelled)."""
+        if permit.probe and permit.generation == self.generation:
+            self._probing = False
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed (0 when not open)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "stale_outcomes": self.stale_outcomes,
+        }
+
+    def _current(self, permit: Permit) -> bool:
+        if permit.generation == self.generation:
+            return True
+        self.stale_outcomes += 1
+        return False
+
+    def _set_state(self, state: str):
+        self.state = state
+        self.generation += 1
+
+    def _open(self):
+        logging.warning(f"Circuit {self.name} opened after {self.failures} failures")
+        self._set_state(OPEN)
+        self.opened_at = time.monotonic()
+        self.trips += 1
@@ -0,0 +1,51 @@
+#
+# JSON responses that skip FastAPI's jsonable_encoder + json.dumps double pass.
+#
+# A route that returns a model (or a list of models) is still run through
+# FastAPI's serializer before any response class sees it, so hot routes return
+# `model_response` / `adapter_response` instead: pydantic-core writes the JSON
+# bytes in one pass. FastJSONResponse, the app-wide default, only swaps the
+# final encoder for the plain data FastAPI hands it: orjson when it is
+# installed, otherwise the stdlib encoder with compact separators.
+#
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+def loads(raw: bytes) -> Any:
+    """Decode a JSON document to plain Python data."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dumps(content: Any) -> bytes:
+    """Encode plain JSON data (dicts, lists, str, numbers, None) to bytes."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """App-wide default response class; encodes already-serialized data with `dumps`."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def model_response(model: BaseModel, status_code: int = 200) -> Response:
+    """Serialize one model in a single pydantic-core pass, bypassing response_model validation."""
+    return Response(content=model.model_dump_json(), status_code=status_code, media_type="application/json")
+
+
+def adapter_response(adapter: TypeAdapter, value: Any, status_code: int = 200) -> Response:
+    """Serialize `value` in a single pydantic-core pass, bypassing response_model validation."""
+    return Response(content=adapter.dump_json(value), status_code=status_code, media_type="application/json")
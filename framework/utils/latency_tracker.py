@@ -0,0 +1,42 @@
+#
+# Rolling latency percentiles per endpoint.
+#
+# Keeps the last `window` samples for each key and recomputes the percentile
+# every `recompute_every` samples, so reading it on every request is cheap.
+#
+import math
+from collections import deque
+from typing import Deque, Dict, Hashable, Optional
+
+
+class LatencyTracker:
+
+    def __init__(self, percentile: float = 0.95, window: int = 200, min_samples: int = 20,
+                 recompute_every: int = 10):
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.recompute_every = recompute_every
+        self._samples: Dict[Hashable, Deque[float]] = {}
+        self._since_recompute: Dict[Hashable, int] = {}
+        self._values: Dict[Hashable, float] = {}
+
+    def record(self, key: Hashable, seconds: float):
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+        count = self._since_recompute.get(key, 0) + 1
+        if count >= self.recompute_every or key not in self._values:
+            count = 0
+            if len(samples) >= self.min_samples:
+                ordered = sorted(samples)
+                self._values[key] = ordered[min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)]
+        self._since_recompute[key] = count
+
+    def value(self, key: Hashable) -> Optional[float]:
+        """The percentile for `key`, or None until it has `min_samples` samples."""
+        return self._values.get(key)
+
+    def stats(self) -> dict:
+        return {str(key): value for key, value in self._values.items()}
@@ -0,0 +1,97 @@
+#
+# Bounded on-disk ring of request profiles.
+#
+# Each profile is a pstats file (`<id>.prof`, loadable with `pstats.Stats` or
+# snakeviz) next to a small JSON sidecar (`<id>.json`) describing the request
+# it came from. Once more than `max_profiles` are stored the oldest are
+# deleted. Ids start with the creation time in milliseconds, so sorting them
+# sorts by age, and profiles left by an earlier process are picked up again.
+#
+# File I/O runs in a worker thread so saving never blocks the event loop.
+#
+import asyncio
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+_PROFILE_ID = re.compile(r"^\d{13}-[0-9a-f]{8}$")
+
+
+class ProfileStore:
+
+    def __init__(self, directory: str, max_profiles: int = 50):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        names = os.listdir(directory) if os.path.isdir(directory) else []
+        self._ids = deque(sorted(name[:-len(".prof")] for name in names
+                                 if name.endswith(".prof") and _PROFILE_ID.match(name[:-len(".prof")])))
+
+    async def save(self, profile: cProfile.Profile, info: dict) -> str:
+        """Store a finished (disabled) profile and return its id."""
+        profile_id = f"{int(time.time() * 1000):013d}-{secrets.token_hex(4)}"
+        await asyncio.to_thread(self._write, profile_id, profile, dict(info, id=profile_id))
+        return profile_id
+
+    async def list(self) -> List[dict]:
+        """Descriptions of the stored profiles, newest first."""
+        return await asyncio.to_thread(self._read_all)
+
+    def path(self, profile_id: str) -> Optional[str]:
+        """Path of the pstats file for `profile_id`, or None if there is no such profile."""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.prof")
+        return path if os.path.exists(path) else None
+
+    async def summary(self, profile_id: str, sort: str = "cumulative", limit: int = 50) -> Optional[str]:
+        """The pstats report for a profile, top `limit` functions by `sort`."""
+        path = self.path(profile_id)
+        if path is None:
+            return None
+
+        def render() -> str:
+            out = io.StringIO()
+            pstats.Stats(path, stream=out).sort_stats(sort).print_stats(limit)
+            return out.getvalue()
+
+        return await asyncio.to_thread(render)
+
+    def _write(self, profile_id: str, profile: cProfile.Profile, info: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, profile_id)
+        profile.dump_stats(f"{base}.prof")
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        with self._lock:
+            self._ids.append(profile_id)
+            expired = [self._ids.popleft() for _ in range(max(0, len(self._ids) - self.max_profiles))]
+        for old in expired:
+            for suffix in (".prof", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, old + suffix))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.warning(f"Could not remove old profile {old}{suffix}: {e}")
+
+    def _read_all(self) -> List[dict]:
+        with self._lock:
+            ids = list(reversed(self._ids))
+        profiles = []
+        for profile_id in ids:
+            try:
+                with open(os.path.join(self.directory, f"{profile_id}.json"), encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                profiles.append({"id": profile_id})
+        return profiles
@@ -0,0 +1,96 @@
+#
+# Background refresh scheduler for stale-while-revalidate reads.
+#
+# Callers answer from whatever data they already have and hand the expensive
+# refresh to this scheduler. Jobs are deduplicated by key, started after a
+# small random delay (so a burst of requests does not refresh everything at
+# once) and run on a fixed number of worker tasks.
+#
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+class RefreshScheduler:
+
+    def __init__(self, workers: int = 4, max_queue: int = 1000, jitter: float = 1.0, name: str = "refresh"):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.jitter = jitter
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Dict[str, float] = {}  # key -> time it was scheduled (queued or running)
+        self._tasks: List[asyncio.Task] = []
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    async def startup(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._pending.clear()
+
+    def schedule(self, key: str, job: Callable[[], Awaitable]) -> bool:
+        """Queue `job` unless a refresh for `key` is already pending. Returns True if queued."""
+        if key in self._pending or not self._tasks:
+            return False
+        self._pending[key] = time.monotonic()
+        delay = random.uniform(0, self.jitter)
+        asyncio.get_running_loop().call_later(delay, self._enqueue, key, job)
+        return True
+
+    def is_pending(self, key: str) -> bool:
+        return key in self._pending
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "pending": len(self._pending),
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "oldest_pending_age": max((now - t for t in self._pending.values()), default=0.0),
+        }
+
+    def _enqueue(self, key: str, job: Callable[[], Awaitable]):
+        if self._queue is None or key not in self._pending:
+            return
+        try:
+            self._queue.put_nowait((key, job))
+        except asyncio.QueueFull:
+            self._pending.pop(key, None)
+            self.dropped += 1
+            logging.warning(f"{self.name} queue full, dropped refresh for {key}")
+
+    async def _worker(self):
+        while True:
+            key, job = await self._queue.get()
+            try:
+                await job()
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"{self.name} refresh for {key} failed: {e}")
+            finally:
+                scheduled_at = self._pending.pop(key, None)
+                if scheduled_at is not None:
+                    self.last_lag = time.monotonic() - scheduled_at
+                    self.max_lag = max(self.max_lag, self.last_lag)
+                self._queue.task_done()
@@ -0,0 +1,51 @@
+#
+# Retry budget shared by every retry and hedge a client makes.
+#
+# Extra attempts are allowed only while they stay under `ratio` of the
+# first attempts seen in the last `window` seconds (plus a small
+# `min_per_window` allowance so a quiet process can still retry). During an
+# outage this caps the added load at `ratio` instead of multiplying it.
+#
+import time
+from collections import deque
+
+
+class RetryBudget:
+
+    def __init__(self, ratio: float = 0.1, min_per_window: int = 10, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_window = min_per_window
+        self.window = window
+        self._requests = deque()  # timestamps of first attempts
+        self._retries = deque()   # timestamps of retries and hedges
+        self.granted = 0
+        self.denied = 0
+
+    def record_request(self):
+        self._requests.append(time.monotonic())
+
+    def try_acquire(self) -> bool:
+        """Take one extra attempt from the budget if there is room."""
+        now = time.monotonic()
+        self._expire(now)
+        if len(self._retries) < self.min_per_window + self.ratio * len(self._requests):
+            self._retries.append(now)
+            self.granted += 1
+            return True
+        self.denied += 1
+        return False
+
+    def stats(self) -> dict:
+        self._expire(time.monotonic())
+        return {
+            "requests_in_window": len(self._requests),
+            "retries_in_window": len(self._retries),
+            "granted": self.granted,
+            "denied": self.denied,
+        }
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        for timestamps in (self._requests, self._retries):
+            while timestamps and timestamps[0] < cutoff:
+                timestamps.popleft()
@@ -0,0 +1,108 @@
+#
+# Export finished traces as OpenTelemetry (OTLP/JSON) documents.
+#
+# The target is either a file path, appended to with one
+# ExportTraceServiceRequest JSON object per line, or an http(s) URL of an
+# OTLP/HTTP collector (e.g. http://localhost:4318/v1/traces). Traces are
+# queued on a write-behind buffer and written in batches off the request path.
+# Export never waits on the request path: when the buffer is full (the
+# collector is slow or down) the trace is dropped and counted in the buffer's
+# `dropped_items`.
+#
+import asyncio
+import json
+from typing import List, Optional
+
+import httpx
+
+from framework.middleware.tracing import CLIENT, SERVER, Trace
+from framework.utils.write_behind import WriteBehindBuffer
+
+# OTLP SpanKind / StatusCode enum values
+_KINDS = {"internal": 1, SERVER: 2, CLIENT: 3}
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+
+def to_otlp(traces: List[Trace], service_name: str) -> dict:
+    """OTLP ExportTraceServiceRequest for `traces`, in the protobuf JSON mapping."""
+    spans = []
+    for trace in traces:
+        for span in trace.spans:
+            item = {
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": _KINDS.get(span.kind, 1),
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns if span.end_ns is not None else span.start_ns),
+                "attributes": [_attribute("correlation.id", trace.correlation_id)]
+                              + [_attribute(key, value) for key, value in span.attributes.items()],
+                "status": {"code": _STATUS_ERROR, "message": span.error} if span.error else {"code": _STATUS_OK},
+            }
+            if span.parent_id:
+                item["parentSpanId"] = span.parent_id
+            spans.append(item)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", service_name)]},
+            "scopeSpans": [{"scope": {"name": service_name}, "spans": spans}],
+        }]
+    }
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class SpanExporter:
+
+    def __init__(self, target: Optional[str] = None, service_name: str = "ui-composite",
+                 buffer: Optional[WriteBehindBuffer] = None):
+        self.target = target
+        self.service_name = service_name
+        self.buffer = buffer if buffer is not None else WriteBehindBuffer(name="span export")
+        self.buffer.flush = self._write
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def startup(self):
+        if self.target:
+            await self.buffer.startup()
+
+    async def shutdown(self):
+        await self.buffer.shutdown()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def export(self, trace: Trace):
+        if not self.target:
+            return
+        if not self.buffer.running:
+            # Outside the app lifespan: write through
+            await self.buffer.put(trace)
+            return
+        self.buffer.offer(trace)
+
+    async def _write(self, traces: List[Trace]):
+        document = to_otlp(traces, self.service_name)
+        if self.target.startswith(("http://", "https://")):
+            if self._client is None:
+                self._client = httpx.AsyncClient(timeout=5.0)
+            response = await self._client.post(self.target, json=document)
+            response.raise_for_status()
+        else:
+            line = json.dumps(document, separators=(",", ":")) + "\n"
+            await asyncio.to_thread(self._append, line)
+
+    def _append(self, line: str):
+        with open(self.target, "a", encoding="utf-8") as f:
+            f.write(line)
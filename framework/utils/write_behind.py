@@ -0,0 +1,119 @@
+#
+# Write-behind buffer: callers enqueue writes and return immediately; a
+# background task flushes them in batches once `max_batch` items are waiting
+# or `max_delay` seconds have passed since the first one arrived.
+#
+# The queue is bounded, so when downstream falls behind `put` waits for room
+# (backpressure) instead of growing memory without limit; callers that must
+# never wait use `offer`, which drops the item instead. Batches are flushed
+# one at a time in arrival order; shutdown drains whatever is still queued,
+# for at most `drain_timeout` seconds so a hung downstream cannot stop the
+# process from exiting.
+#
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+
+class WriteBehindBuffer:
+
+    def __init__(self,
+                 flush: Optional[Callable[[List[Any]], Awaitable]] = None,
+                 max_batch: int = 50,
+                 max_delay: float = 0.5,
+                 max_pending: int = 1000,
+                 drain_timeout: float = 10.0,
+                 name: str = "write-behind"):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.drain_timeout = drain_timeout
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushed_batches = 0
+        self.flushed_items = 0
+        self.failed_batches = 0
+        self.dropped_items = 0
+        self._flushing = 0  # items in the batch being flushed right now
+
+    async def startup(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self):
+        """Flush everything still queued (for up to `drain_timeout` seconds), then stop."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            dropped = self._queue.qsize() + self._flushing
+            self.dropped_items += dropped
+            logging.error(f"{self.name} did not drain within {self.drain_timeout}s, dropped {dropped} items")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def offer(self, item: Any) -> bool:
+        """Queue `item` without waiting. Drops it and returns False if the buffer is full or not running."""
+        if self._task is None:
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped_items += 1
+            return False
+        return True
+
+    async def put(self, item: Any):
+        if self._task is None:
+            # Not started (e.g. used outside the app lifespan): write through
+            await self._flush([item])
+            return
+        await self._queue.put(item)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize() if self._queue else 0,
+            "flushed_batches": self.flushed_batches,
+            "flushed_items": self.flushed_items,
+            "failed_batches": self.failed_batches,
+            "dropped_items": self.dropped_items,
+        }
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._flushing = len(batch)
+            try:
+                await self._flush(batch)
+            finally:
+                self._flushing = 0
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: List[Any]):
+        try:
+            await self.flush(batch)
+            self.flushed_batches += 1
+            self.flushed_items += len(batch)
+        except Exception as e:
+            self.failed_batches += 1
+            logging.error(f"{self.name} flush of {len(batch)} items failed: {e}")
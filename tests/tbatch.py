@@ -0,0 +1,65 @@
+#
+# POST /batch must never run /batch again, however the path is spelled.
+#
+#   python -m tests.tbatch
+#
+import asyncio
+import os
+
+import httpx
+import jwt
+
+JWT_SECRET = os.environ.setdefault("JWT_SECRET", "tbatch")
+for name in ("SPOTIFY", "USER", "PLAYLIST", "CHAT", "SONG"):
+    os.environ.setdefault(f"{name}_URL", f"http://{name.lower()}.invalid")
+
+from app.main import app  # reads the settings above at import
+from app.routers.batch import _mark_sub_requests
+from app.utils import jwt_claims
+
+TOKEN = jwt.encode({"sub": "u1", "scopes": {}}, JWT_SECRET, algorithm="HS256")
+NESTED = ["/batch", "/batch/", "/%62atch", "/%62%61%74%63%68", "/./batch", "/x/../batch", "/users/../batch"]
+
+
+async def post_batch(target_app, paths, method="POST"):
+    transport = httpx.ASGITransport(app=target_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post("/batch", headers={"Authorization": f"Bearer {TOKEN}"},
+                                 json={"requests": [{"id": path, "method": method, "path": path,
+                                                     "body": {"requests": []}} for path in paths]})
+
+
+def t1():
+    """Every spelling of /batch is refused as an item."""
+    response = asyncio.run(post_batch(app, NESTED))
+    print("t1 result = \n", response.status_code, response.json())
+    assert response.status_code == 200
+    assert [(item["id"], item["status"]) for item in response.json()] == [(path, 400) for path in NESTED]
+
+
+def t2():
+    """A sub-request that reaches /batch anyway is refused by the route itself."""
+    response = asyncio.run(post_batch(_mark_sub_requests(app), []))
+    print("t2 result = \n", response.status_code, response.json())
+    assert response.status_code == 400
+
+
+def t3():
+    """The token is decoded once for the whole batch, not once per sub-request."""
+    decodes = []
+    decode = jwt_claims.jwt.decode
+    jwt_claims.jwt.decode = lambda *args, **kwargs: decodes.append(args[0]) or decode(*args, **kwargs)
+    try:
+        response = asyncio.run(post_batch(app, ["/playlists/p1"] * 3, method="GET"))
+    finally:
+        jwt_claims.jwt.decode = decode
+    print("t3 result = \n", response.status_code, response.json(), len(decodes))
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()] == [401] * 3  # no /playlists scope
+    assert decodes == [TOKEN]
+
+
+if __name__ == '__main__':
+    t1()
+    t2()
+    t3()
@@ -0,0 +1,60 @@
+from app.models.adapters import PLAYLIST_INFO_LIST, PLAYLIST_LIST, SONG_LIST
+from app.models.playlist import Playlist, PlaylistInfo
+from app.models.song import Song
+from app.models.song_batch import SongBatch
+from pydantic import parse_obj_as
+from typing import List
+import json
+import timeit
+import warnings
+
+
+def playlist_info(i):
+    return {"playlist_id": f"p{i}", "playlist_name": f"Playlist {i}", "user_id": "u1",
+            "user_name": "user", "created_at": "2024-10-01T12:00:00", "times_played": i}
+
+
+def playlist(i):
+    return {"id": f"p{i}", "name": f"Playlist {i}", "description": "mix", "owner_id": "u1",
+            "image_url": None, "spotify_branch": None, "tracks": [f"t{i}", f"t{i + 1}"]}
+
+
+def song(i):
+    return {"track_id": f"t{i}", "track_name": f"Song {i}", "track_artist": "artist",
+            "track_popularity": 50.0, "track_album_id": "a1", "track_album_name": "album",
+            "track_album_release_date": "2020-01-01", "playlist_name": None, "playlist_id": None,
+            "playlist_genre": "pop", "playlist_subgenre": None, "danceability": 0.5,
+            "energy": 0.7, "key": 5.0, "loudness": -6.0, "mode": 1.0, "speechiness": 0.05,
+            "acousticness": 0.1, "instrumentalness": 0.0, "liveness": 0.1, "valence": 0.6,
+            "tempo": 120.0, "duration_ms": 200000.0}
+
+
+def bench(label, func, number):
+    best = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"  {label:<32} {best * 1000:9.3f} ms")
+    return best
+
+
+def t1():
+    """Per-item parse_obj over response.json() vs one TypeAdapter.validate_json pass."""
+    warnings.simplefilter("ignore", DeprecationWarning)
+    cases = [
+        ("List[PlaylistInfo]", playlist_info, PlaylistInfo, PLAYLIST_INFO_LIST),
+        ("List[Playlist]", playlist, Playlist, PLAYLIST_LIST),
+        ("List[Song]", song, Song, SONG_LIST),
+    ]
+    for size in (1000, 10000):
+        number = 20 if size == 1000 else 3
+        for name, make, model, adapter in cases:
+            raw = json.dumps([make(i) for i in range(size)]).encode()
+            print(f"{name} x {size} ({len(raw) // 1024} KiB)")
+            old = bench("json.loads + parse_obj per item", lambda: [model.parse_obj(o) for o in json.loads(raw)], number)
+            bench("parse_obj_as(json.loads)", lambda: parse_obj_as(List[model], json.loads(raw)), number)
+            new = bench("TypeAdapter.validate_json", lambda: adapter.validate_json(raw), number)
+            if model is Song:
+                bench("SongBatch.from_json (columnar)", lambda: SongBatch.from_json(raw), number)
+            print(f"  speedup {old / new:.1f}x")
+
+
+if __name__ == '__main__':
+    t1()
@@ -0,0 +1,339 @@
+#
+# Load test for the composite against local stub downstream services.
+#
+# Starts one in-process HTTP stub per downstream (Spotify adapter, user,
+# playlist, chat, song) with its own latency distribution and payload sizes,
+# runs the real app under uvicorn on top of them, and drives /chats,
+# /recommendations, /users/{id}/playlists and /playlists/{id} at a fixed
+# concurrency. Reports throughput and p50/p95/p99 per route and writes them to
+# a JSON file (--out, by default tbench_load.json in the system temp directory)
+# that can be compared with a stored baseline:
+#
+#   python -m tests.tbench_load --concurrency 50 --duration 20 --out bench.json
+#   python -m tests.tbench_load --baseline tests/tbench_load_baseline.json
+#
+# Latencies are given in milliseconds as "20" (constant), "uniform:10:30",
+# "lognormal:20:0.5" (median, sigma) or "exp:20" (mean), e.g.
+# --latency chat=lognormal:800:0.4. Everything shares one event loop, so the
+# load generator competes with the app for CPU; compare runs made the same way
+# on the same machine.
+#
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import socket
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import jwt
+import uvicorn
+
+from tests.tbench_decode import playlist, playlist_info, song
+
+JWT_SECRET = os.environ.setdefault("JWT_SECRET", "tbench-load")
+USER_ID = "u1"
+SCOPES = {
+    "/users/{user_id}/playlists": ["GET", "POST"], "/users/{user_id}": ["GET", "PUT"],
+    "/playlists/{playlist_id}": ["GET", "POST", "DELETE"], "/playlists/{playlist_id}/tracks/{track_id}": ["DELETE"],
+    "/chats": ["POST"], "/recommendations": ["GET", "POST"],
+}
+DOWNSTREAMS = ("spotify", "user", "playlist", "chat", "song")
+# An LLM behind the chat service dominates; the rest are database-backed services,
+# including the chat service's own history writes ("chat_history")
+DEFAULT_LATENCY = {
+    "spotify": "lognormal:40:0.5",
+    "user": "lognormal:5:0.5",
+    "playlist": "lognormal:8:0.5",
+    "chat": "lognormal:300:0.4",
+    "chat_history": "lognormal:10:0.5",
+    "song": "lognormal:10:0.5",
+}
+ROUTES = ("chats", "recommendations", "user_playlists", "playlist")
+
+
+def latency(spec: str) -> Callable[[], float]:
+    """Sampler, in seconds, for a latency spec in milliseconds."""
+    kind, _, params = spec.partition(":")
+    if not params:
+        value = float(kind) / 1000
+        return lambda: value
+    args = [float(p) for p in params.split(":")]
+    if kind == "uniform":
+        return lambda: random.uniform(args[0] / 1000, args[1] / 1000)
+    if kind == "lognormal":
+        mu = math.log(args[0] / 1000)
+        return lambda: random.lognormvariate(mu, args[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1000 / args[0])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+class Stub:
+    """ASGI downstream answering from canned bodies after a sampled delay."""
+
+    def __init__(self, name: str, delay: Callable[[], float], routes: List[tuple]):
+        self.name = name
+        self.delay = delay
+        # (method, compiled path pattern, encoded JSON body, delay or None for the stub's), first match wins
+        self.routes = [(method, re.compile(pattern), json.dumps(body).encode(), route_delay)
+                       for method, pattern, body, *route_delay in routes]
+        self.requests = 0
+
+    async def __call__(self, scope, receive, send):
+        while True:
+            message = await receive()
+            if not message.get("more_body"):
+                break
+        self.requests += 1
+        status, body, delay = 404, b'{"detail":"Not Found"}', self.delay
+        for method, pattern, payload, route_delay in self.routes:
+            if method == scope["method"] and pattern.fullmatch(scope["path"]):
+                status, body = 200, payload
+                delay = route_delay[0] if route_delay else delay
+                break
+        await asyncio.sleep(delay())
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def stubs(latencies: Dict[str, str], songs: int, playlists: int, reply_bytes: int) -> Dict[str, Stub]:
+    token = {"access_token": "access", "token_type": "Bearer", "scope": "playlist-read-private",
+             "expires_in": 3600, "refresh_token": "refresh"}
+    traits = {"genres": ["pop"], "target_energy": 0.7, "limit": songs}
+    ok = {"ok": True}
+    routes = {
+        "spotify": [
+            ("GET", r"/recommendations", [song(i) for i in range(songs)]),
+            ("GET", r"/users/[^/]+/refreshed_token", token),
+            ("GET", r"/users/[^/]+/playlists", [playlist(i) for i in range(playlists)]),
+        ],
+        "user": [
+            ("GET", r"/users/[^/]+/spotify_token", token),
+            ("PUT", r"/users/[^/]+/spotify_token", ok),
+            ("GET", r"/users/[^/]+", {"id": USER_ID, "username": "user", "email": "user@example.com"}),
+        ],
+        "playlist": [
+            # Read by the /users/{id}/playlists route, which serves the Spotify-shaped playlists
+            ("GET", r"/users/[^/]+/playlists", [playlist(i) for i in range(playlists)]),
+            ("GET", r"/playlists/[^/]+", playlist_info(0)),
+            ("POST", r"/playlists/[^/]+", ok),
+        ],
+        "chat": [
+            ("POST", r"/general_chat", {"content": "x" * reply_bytes, "traits": traits}),
+            ("POST", r"/extract_traits", traits),
+            ("POST", r"/update_chat", ok, latency(latencies["chat_history"])),
+            ("POST", r"/analyze_preference", ok),
+        ],
+        "song": [("POST", r"/songs", ok)],
+    }
+    return {name: Stub(name, latency(latencies[name]), routes[name]) for name in DOWNSTREAMS}
+
+
+def listen() -> socket.socket:
+    # IPPROTO_TCP so asyncio sets TCP_NODELAY on accepted connections; otherwise Nagle adds ~40 ms per response
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def summarize(samples: List[tuple], elapsed: float) -> dict:
+    """Throughput and latency percentiles (ms) per route and overall."""
+    by_route: Dict[str, List[tuple]] = {}
+    for route, seconds, status in samples:
+        by_route.setdefault(route, []).append((seconds, status))
+        by_route.setdefault("all", []).append((seconds, status))
+    results = {}
+    for route, values in sorted(by_route.items()):
+        latencies = sorted(seconds * 1000 for seconds, _ in values)
+        results[route] = {
+            "requests": len(values),
+            "errors": sum(1 for _, status in values if status >= 400),
+            "throughput_rps": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+        }
+    return results
+
+
+def request_for(route: str, i: int, ids: int, token: str) -> tuple:
+    """(method, path, kwargs) for the i-th request to `route`, cycling through `ids` distinct ids."""
+    headers = {"Authorization": f"Bearer {token}"}
+    n = i % ids
+    if route == "chats":
+        return "POST", "/chats", {"json": {"user_id": USER_ID, "query": f"upbeat songs for a run {n}", "token": token}}
+    if route == "recommendations":
+        return "POST", "/recommendations", {"params": {"user_id": USER_ID}, "headers": headers,
+                                            "json": {"message": f"calm songs to study {n}", "userId": USER_ID}}
+    if route == "user_playlists":
+        return "GET", f"/users/{USER_ID}/playlists", {"headers": headers}
+    return "GET", f"/playlists/p{n}", {"headers": headers}
+
+
+async def drive(base_url: str, routes: List[str], concurrency: int, duration: float, warmup: float,
+                ids: int, token: str) -> tuple:
+    samples = []
+    counter = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        started = time.perf_counter()
+        measure_from = started + warmup
+        stop = measure_from + duration
+
+        async def worker():
+            nonlocal counter
+            while time.perf_counter() < stop:
+                i = counter
+                counter += 1
+                route = routes[i % len(routes)]
+                method, path, kwargs = request_for(route, i // len(routes), ids, token)
+                sent = time.perf_counter()
+                try:
+                    status = (await client.request(method, path, **kwargs)).status_code
+                except httpx.HTTPError:
+                    status = 599
+                if sent >= measure_from:
+                    samples.append((route, time.perf_counter() - sent, status))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - measure_from
+    return samples, elapsed
+
+
+async def run(args) -> dict:
+    latencies = dict(DEFAULT_LATENCY, **dict(spec.split("=", 1) for spec in args.latency))
+    servers = stubs(latencies, args.songs, args.playlists, args.reply_bytes)
+    sockets = {name: listen() for name in (*DOWNSTREAMS, "app")}
+    for name in DOWNSTREAMS:
+        os.environ[f"{name.upper()}_URL"] = f"http://127.0.0.1:{sockets[name].getsockname()[1]}"
+
+    from app.main import app  # reads the downstream URLs at import
+
+    running = []
+    for name, asgi in (*servers.items(), ("app", app)):
+        # Stubs keep idle connections open longer than HttpClient's keep-alive expiry, as real services would
+        config = uvicorn.Config(asgi, log_level="warning", access_log=False, timeout_keep_alive=60,
+                                lifespan="on" if name == "app" else "off")
+        server = uvicorn.Server(config)
+        running.append((server, asyncio.create_task(server.serve(sockets=[sockets[name]]))))
+    # uvicorn's logging config resets the "uvicorn" logger the routes log to
+    for name in ("uvicorn", ""):
+        logging.getLogger(name).setLevel(args.log_level.upper())
+    while not all(server.started for server, _ in running):
+        await asyncio.sleep(0.01)
+
+    token = jwt.encode({"sub": USER_ID, "scopes": SCOPES}, JWT_SECRET, algorithm="HS256")
+    drain = None
+    try:
+        samples, elapsed = await drive(f"http://127.0.0.1:{sockets['app'].getsockname()[1]}", args.routes,
+                                       args.concurrency, args.duration, args.warmup, args.ids, token)
+    finally:
+        # The app first, so its shutdown can still flush queued writes to the stubs
+        for server, task in reversed(running):
+            server.should_exit = True
+            started = time.perf_counter()
+            await asyncio.gather(task, return_exceptions=True)
+            if server.config.app is app:
+                drain = time.perf_counter() - started
+
+    return {
+        "config": {
+            "routes": args.routes, "concurrency": args.concurrency, "duration": args.duration,
+            "warmup": args.warmup, "ids": args.ids, "songs": args.songs, "playlists": args.playlists,
+            "reply_bytes": args.reply_bytes, "latency": latencies, "log_level": args.log_level,
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "downstream_requests": {name: stub.requests for name, stub in servers.items()},
+        # Time the app took to stop, mostly flushing write-behind queues the load left behind
+        "shutdown_seconds": round(drain, 2),
+        "results": summarize(samples, elapsed),
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> bool:
+    """Print the change against a baseline; False if any route's p95 or throughput regressed past `tolerance`."""
+    ok = True
+    def shape(result: dict) -> dict:
+        # How long a run lasts does not change the load it applies
+        return {k: v for k, v in result.get("config", {}).items() if k not in ("duration", "warmup")}
+
+    if shape(current) != shape(baseline):
+        print("warning: baseline was recorded with a different configuration")
+    print(f"\n{'vs baseline':<16} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for route, result in current["results"].items():
+        before = baseline.get("results", {}).get(route)
+        if before is None:
+            print(f"{route:<16} {'(new)':>9}")
+            continue
+        changes = {key: (result[key] - before[key]) / before[key] if before[key] else 0.0
+                   for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")}
+        print(f"{route:<16} " + " ".join(f"{changes[key]:>+9.1%}"
+                                         for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")))
+        if changes["p95_ms"] > tolerance or changes["throughput_rps"] < -tolerance:
+            ok = False
+    return ok
+
+
+def report(result: dict):
+    print(f"{'route':<16} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, r in result["results"].items():
+        print(f"{route:<16} {r['requests']:>9} {r['errors']:>7} {r['throughput_rps']:>9.1f} "
+              f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}")
+    print("downstream requests: " + ", ".join(f"{k}={v}" for k, v in result["downstream_requests"].items()))
+    print(f"app shutdown: {result['shutdown_seconds']:.2f} s")
+
+
+def t1(argv: Optional[List[str]] = None) -> int:
+    """Run the load test described by `argv` (see --help)."""
+    parser = argparse.ArgumentParser(prog="python -m tests.tbench_load")
+    parser.add_argument("--routes", nargs="+", choices=ROUTES, default=list(ROUTES))
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of load before measuring")
+    parser.add_argument("--ids", type=int, default=1000, help="distinct playlist ids / queries to cycle through")
+    parser.add_argument("--songs", type=int, default=20, help="songs per recommendation response")
+    parser.add_argument("--playlists", type=int, default=20, help="playlists per user")
+    parser.add_argument("--reply-bytes", type=int, default=500, help="size of the chat agent's reply")
+    parser.add_argument("--latency", nargs="*", default=[], metavar="SERVICE=SPEC",
+                        help=f"per-downstream latency in ms, defaults: {DEFAULT_LATENCY}")
+    parser.add_argument("--log-level", default="warning",
+                        help="app log level; 'info' includes the cost of its per-request logging")
+    parser.add_argument("--out", default=os.path.join(tempfile.gettempdir(), "tbench_load.json"))
+    parser.add_argument("--baseline", help="earlier --out file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed p95 increase / throughput drop vs the baseline (0.1 = 10%%)")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    report(result)
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            if not compare(result, json.load(f), args.tolerance):
+                print("regression beyond tolerance")
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(t1())
@@ -0,0 +1,43 @@
+from app.models.adapters import SONG_LIST
+from app.models.song import Song
+from app.models.song_batch import SongBatch
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.utils import create_response_field
+from framework.utils.json_response import FastJSONResponse, orjson
+from typing import List
+import timeit
+from tests.tbench_decode import song
+
+
+def bench(label, func, number):
+    best = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"  {label:<40} {best * 1000:9.3f} ms")
+    return best
+
+
+def t1():
+    """Serialization cost of a recommendation response, per response-body strategy."""
+    field = create_response_field(name="Response", type_=List[Song], mode="serialization")
+    print(f"orjson: {'available' if orjson is not None else 'not installed'}")
+    for size in (10, 100, 1000):
+        number = {10: 2000, 100: 300, 1000: 30}[size]
+        songs = [Song(**song(i)) for i in range(size)]
+        batch = SongBatch.from_songs(songs)
+
+        def fastapi_model():
+            # What fastapi.routing.serialize_response does for response_model=List[Song]
+            value, _ = field.validate(songs, {}, loc=("response",))
+            return JSONResponse(field.serialize(value, mode="json")).body
+
+        print(f"{size} songs")
+        old = bench("response_model + JSONResponse", fastapi_model, number)
+        bench("jsonable_encoder + JSONResponse", lambda: JSONResponse(jsonable_encoder(songs)).body, number)
+        bench("jsonable_encoder + FastJSONResponse", lambda: FastJSONResponse(jsonable_encoder(songs)).body, number)
+        bench("TypeAdapter.dump_json", lambda: SONG_LIST.dump_json(songs), number)
+        new = bench("SongBatch.to_json", batch.to_json, number)
+        print(f"  speedup {old / new:.1f}x")
+
+
+if __name__ == '__main__':
+    t1()
@@ -0,0 +1,46 @@
+#
+# Circuit breaker: outcomes of calls from an earlier state are ignored.
+#
+#   python -m tests.tcircuit_breaker
+#
+from framework.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def t1():
+    """A slow success that started before the circuit opened does not close it."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    slow = breaker.acquire()
+    breaker.record_failure(breaker.acquire())
+    breaker.record_success(slow)
+    print("t1 result = \n", breaker.stats())
+    assert breaker.state == OPEN and breaker.stats()["stale_outcomes"] == 1
+
+
+def t2():
+    """Only the probe gives back the half-open probe slot."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    old = breaker.acquire()
+    breaker.record_failure(breaker.acquire())
+    probe = breaker.acquire()
+    assert breaker.state == HALF_OPEN and probe.probe
+    breaker.release(old)  # e.g. a cancelled call from before the circuit opened
+    second = breaker.acquire()
+    breaker.release(probe)
+    third = breaker.acquire()
+    print("t2 result = \n", second, third, breaker.stats())
+    assert second is None and third is not None and third.probe
+
+
+def t3():
+    """A successful probe closes the circuit."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure(breaker.acquire())
+    breaker.record_success(breaker.acquire())
+    print("t3 result = \n", breaker.stats())
+    assert breaker.state == CLOSED and breaker.acquire() is not None
+
+
+if __name__ == '__main__':
+    t1()
+    t2()
+    t3()
@@ -0,0 +1,76 @@
+#
+# Coalesced downstream calls: every caller keeps its own deadline and span.
+#
+#   python -m tests.thttp_client
+#
+import asyncio
+import time
+
+import httpx
+
+from framework.middleware import deadline, tracing
+from framework.services.http_client import DeadlineExceeded, HttpClient
+
+DOWNSTREAM_DELAY = 0.3
+
+
+async def slow(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(DOWNSTREAM_DELAY)
+    return httpx.Response(200, json={"ok": True})
+
+
+def get_client() -> HttpClient:
+    client = HttpClient()
+    client.add_downstream("user", "http://user")
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(slow))
+    return client
+
+
+async def waiter(client: HttpClient, name: str, budget: float, start_after: float = 0.0):
+    """GET /users/u1 as its own request with a `budget` second deadline."""
+    await asyncio.sleep(start_after)
+    trace = tracing.Trace(name, name * 32)
+    tracing._trace.set(trace)
+    deadline.set_deadline(budget)
+    started = time.monotonic()
+    try:
+        response = await client.request("GET", "http://user/users/u1")
+        outcome = response.status_code
+    except DeadlineExceeded:
+        outcome = "deadline"
+    return outcome, time.monotonic() - started, trace.spans
+
+
+async def two_waiters(first_budget: float, second_budget: float):
+    client = get_client()
+    results = await asyncio.gather(waiter(client, "a", first_budget),
+                                   waiter(client, "b", second_budget, start_after=0.01))
+    stats = client.stats()
+    await client.aclose()
+    return results, stats
+
+
+def t1():
+    """A caller with a short budget gives up at its own deadline; the other still gets the response."""
+    ((a, a_elapsed, a_spans), (b, b_elapsed, b_spans)), stats = asyncio.run(two_waiters(1.0, 0.1))
+    print("t1 result = \n", a, round(a_elapsed, 3), b, round(b_elapsed, 3), stats["upstream_requests"])
+    assert stats["upstream_requests"] == 1 and stats["coalesced_requests"] == 1
+    assert a == 200
+    assert b == "deadline" and b_elapsed < DOWNSTREAM_DELAY
+    assert [s.attributes["http.coalesced"] for s in a_spans] == [False]
+    assert [s.attributes["http.coalesced"] for s in b_spans] == [True] and b_spans[0].error
+
+
+def t2():
+    """The first caller's short deadline does not cut the shared call short for a later caller."""
+    ((a, a_elapsed, a_spans), (b, b_elapsed, b_spans)), stats = asyncio.run(two_waiters(0.1, 1.0))
+    print("t2 result = \n", a, round(a_elapsed, 3), b, round(b_elapsed, 3), stats["upstream_requests"])
+    assert stats["upstream_requests"] == 1
+    assert a == "deadline" and a_elapsed < DOWNSTREAM_DELAY
+    assert b == 200
+    assert len(a_spans) == 1 and len(b_spans) == 1 and b_spans[0].error is None
+
+
+if __name__ == '__main__':
+    t1()
+    t2()
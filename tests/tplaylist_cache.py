@@ -0,0 +1,62 @@
+#
+# GET /playlists/{id} is cached; writes through the API evict it.
+#
+#   python -m tests.tplaylist_cache
+#
+import asyncio
+import os
+
+import httpx
+import jwt
+
+JWT_SECRET = os.environ.setdefault("JWT_SECRET", "tplaylist-cache")
+for name in ("SPOTIFY", "USER", "PLAYLIST", "CHAT", "SONG"):
+    os.environ.setdefault(f"{name}_URL", f"http://{name.lower()}")
+
+from app.main import app  # reads the settings above at import
+from app.services.service_factory import ServiceFactory
+
+# The scopes real tokens carry (see POST /token)
+SCOPES = {"/playlists/{playlist_id}": ["GET", "POST", "DELETE"]}
+TOKEN = jwt.encode({"sub": "u1", "scopes": SCOPES}, JWT_SECRET, algorithm="HS256")
+INFO = {"playlist_id": "p1", "playlist_name": "Mix", "user_id": "u1", "user_name": "user",
+        "created_at": None, "times_played": 1}
+CONTENT = {"playlist_id": "p1", "playlist_name": "Mix", "track_id": "t1", "track_name": "Song",
+           "added_at": None, "times_played": 1}
+
+
+async def read_write_read():
+    reads = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            reads.append(request.url.path)
+            return httpx.Response(200, json=INFO)
+        return httpx.Response(200, json={"message": "ok"})
+
+    ServiceFactory.get_service("HttpClient")._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    statuses = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        for _ in range(2):
+            statuses.append((await client.get("/playlists/p1", headers=headers)).status_code)
+        cached_reads = len(reads)
+        response = await client.post("/playlists/p1", json={"playlist_info": INFO, "playlist_content": CONTENT,
+                                                            "token": TOKEN})
+        statuses.append(response.status_code)
+        statuses.append((await client.get("/playlists/p1", headers=headers)).status_code)
+        invalid = await client.post("/playlists/p1", json={"playlist_info": {"playlist_id": "p1"}, "token": TOKEN})
+    return statuses, cached_reads, len(reads), invalid.status_code
+
+
+def t1():
+    """The second GET is a cache hit; a POST evicts it, so the next GET goes downstream."""
+    statuses, cached_reads, reads, invalid = asyncio.run(read_write_read())
+    print("t1 result = \n", statuses, cached_reads, reads, invalid)
+    assert statuses == [200, 200, 202, 200]
+    assert cached_reads == 1 and reads == 2
+    assert invalid == 422
+
+
+if __name__ == '__main__':
+    t1()
@@ -0,0 +1,92 @@
+#
+# Spotify token refresh: rejected refresh tokens and per-caller deadlines.
+#
+#   python -m tests.ttoken_cache
+#
+import asyncio
+import os
+
+import httpx
+import jwt
+
+JWT_SECRET = os.environ.setdefault("JWT_SECRET", "ttoken-cache")
+
+from app.models.spotify_token import SpotifyToken
+from app.services.user import UserService
+from app.utils.token_cache import SpotifyTokenCache
+from framework.middleware import deadline
+from framework.services.http_client import DeadlineExceeded, HttpClient
+
+TOKEN = jwt.encode({"sub": "u1", "scopes": {}}, JWT_SECRET, algorithm="HS256")
+
+
+def spotify_token(access_token: str, refresh_token: str) -> dict:
+    # expires_in is inside the cache's refresh margin, so every call refreshes
+    return {"access_token": access_token, "token_type": "Bearer", "scope": "s",
+            "expires_in": 30, "refresh_token": refresh_token}
+
+
+async def refresh_after_rotation():
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append((request.method, request.url.host, request.url.path))
+        if request.url.host == "user" and request.method == "GET":
+            return httpx.Response(200, json=spotify_token("from-user", "r-user"))
+        if request.url.host == "user":
+            return httpx.Response(200, json={})
+        if request.url.params.get("refresh_token") != "r-user":
+            return httpx.Response(400, json={"error": "invalid_grant"})
+        # Spotify rotates the refresh token; the one it returns is dead by the next refresh
+        return httpx.Response(200, json=spotify_token(f"a{len(calls)}", "r-rotated"))
+
+    client = HttpClient()
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    service = UserService("http://spotify", "http://user", "http://playlist", client, SpotifyTokenCache())
+    first = await service.get_spotify_token("u1", TOKEN, "cid")
+    second = await service.get_spotify_token("u1", TOKEN, "cid")
+    await service.shutdown()
+    await client.aclose()
+    return first, second, calls
+
+
+def t1():
+    """A refresh token the adapter rejects is dropped and the user service's copy is used instead."""
+    first, second, calls = asyncio.run(refresh_after_rotation())
+    print("t1 result = \n", first, second, calls)
+    assert first is not None and second is not None
+    assert [c for c in calls if c == ("GET", "user", "/users/u1/spotify_token")] == [("GET", "user", "/users/u1/spotify_token")] * 2
+
+
+async def waiter(cache: SpotifyTokenCache, refresh, budget: float, start_after: float = 0.0):
+    await asyncio.sleep(start_after)
+    deadline.set_deadline(budget)
+    try:
+        return await cache.get_or_refresh("u1", refresh)
+    except DeadlineExceeded:
+        return "deadline"
+
+
+async def two_waiters(first_budget: float, second_budget: float):
+    cache = SpotifyTokenCache()
+
+    async def refresh():
+        await asyncio.sleep(0.3)
+        return SpotifyToken(**dict(spotify_token("a", "r"), expires_in=3600))
+
+    results = await asyncio.gather(waiter(cache, refresh, first_budget),
+                                   waiter(cache, refresh, second_budget, start_after=0.01))
+    return results, cache.peek("u1")
+
+
+def t2():
+    """The first caller's short deadline neither fails nor discards the refresh for a later caller."""
+    (first, second), cached = asyncio.run(two_waiters(0.1, 1.0))
+    print("t2 result = \n", first, second, cached)
+    assert first == "deadline"
+    assert second is not None and second != "deadline" and cached is not None
+
+
+if __name__ == '__main__':
+    t1()
+    t2()